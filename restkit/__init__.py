@@ -9,11 +9,13 @@ try:
     from restkit.conn import Connection
     from restkit.errors import ResourceNotFound, Unauthorized, RequestFailed,\
 RedirectLimit, RequestError, InvalidUrl, ResponseError, ProxyError, \
-ResourceError, ResourceGone
+ResourceError, ResourceGone, CircuitBreakerOpen, PoolTimeout
     from restkit.client import Client, MAX_FOLLOW_REDIRECTS
     from restkit.wrappers import Request, Response, ClientResponse
     from restkit.resource import Resource
     from restkit.filters import BasicAuth, OAuthFilter
+    from restkit.retry import RetryPolicy, RetryBudget
+    from restkit.breaker import CircuitBreaker
 except ImportError:
     import traceback
     traceback.print_exc()
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+"""
+restkit.backends
+~~~~~~~~~~~~~~~~
+
+Concurrency primitives (spawn, Event, Queue, Lock) for the backends
+supported by socketpool: "thread", "gevent" and "eventlet".
+"""
+
+import threading
+import Queue
+
+_backends = {}
+
+def backend_name(backend):
+    """ return the short name of a backend. `backend` can be a name or
+    a socketpool backend module. """
+    if not isinstance(backend, basestring):
+        backend = getattr(backend, '__name__', str(backend))
+    return backend.rsplit(".", 1)[-1].replace("backend_", "")
+
+
+class Backend(object):
+
+    def __init__(self, name, spawn, event_class, queue_class, lock_class):
+        self.name = name
+        self.spawn = spawn
+        self.Event = event_class
+        self.Queue = queue_class
+        self.Lock = lock_class
+
+    def __repr__(self):
+        return "<%s %s>" % (self.__class__.__name__, self.name)
+
+
+def _spawn_thread(func, *args, **kwargs):
+    t = threading.Thread(target=func, args=args, kwargs=kwargs)
+    t.setDaemon(True)
+    t.start()
+    return t
+
+def _load_thread():
+    return Backend("thread", _spawn_thread, threading.Event, Queue.Queue,
+            threading.Lock)
+
+def _load_gevent():
+    import gevent
+    from gevent import event, queue
+    try:
+        from gevent.lock import Semaphore
+    except ImportError:
+        #gevent < 1.0b2
+        from gevent.coros import Semaphore
+    return Backend("gevent", gevent.spawn, event.Event, queue.Queue,
+            Semaphore)
+
+def _load_eventlet():
+    import eventlet
+    from eventlet import queue, semaphore
+    from eventlet.green import threading as green_threading
+    return Backend("eventlet", eventlet.spawn, green_threading.Event,
+            queue.Queue, semaphore.Semaphore)
+
+_loaders = {
+    "thread": _load_thread,
+    "gevent": _load_gevent,
+    "eventlet": _load_eventlet
+}
+
+def load_backend(backend):
+    """ return the `Backend` instance for a backend name or a socketpool
+    backend module. """
+    name = backend_name(backend)
+    if name not in _backends:
+        if name not in _loaders:
+            raise ValueError("unsupported backend: %s" % name)
+        _backends[name] = _loaders[name]()
+    return _backends[name]
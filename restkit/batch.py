@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+"""
+restkit.batch
+~~~~~~~~~~~~~
+
+Futures and a bounded executor running jobs on threads or greenlets
+depending on the backend.
+"""
+
+import logging
+import sys
+
+from restkit.backends import load_backend
+from restkit.errors import RequestTimeout
+
+log = logging.getLogger(__name__)
+
+
+class Future(object):
+    """ result of a job submitted to an `Executor` """
+
+    def __init__(self, event_class, lock_class):
+        self._event = event_class()
+        self._lock = lock_class()
+        self._result = None
+        self._exc_info = None
+        self._callbacks = []
+
+    def done(self):
+        return self._event.is_set()
+
+    def _wait(self, timeout=None):
+        self._event.wait(timeout)
+        if not self._event.is_set():
+            raise RequestTimeout("future not done after %ss" % timeout)
+
+    def result(self, timeout=None):
+        """ return the result of the job, or raise its exception """
+        self._wait(timeout)
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+    def exception(self, timeout=None):
+        """ return the exception raised by the job or None """
+        self._wait(timeout)
+        if self._exc_info is not None:
+            return self._exc_info[1]
+        return None
+
+    def add_done_callback(self, fn):
+        """ call fn(future) when the job is done """
+        with self._lock:
+            if not self.done():
+                self._callbacks.append(fn)
+                return
+        fn(self)
+
+    def set_result(self, result):
+        self._result = result
+        self._finish()
+
+    def set_exception(self, exc_info):
+        self._exc_info = exc_info
+        self._finish()
+
+    def _finish(self):
+        with self._lock:
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for fn in callbacks:
+            try:
+                fn(self)
+            except Exception:
+                log.exception("error in future callback")
+
+
+class Executor(object):
+    """ run jobs with at most `max_workers` threads or greenlets """
+
+    def __init__(self, backend="thread", max_workers=10):
+        self.backend = load_backend(backend)
+        self.max_workers = max(1, max_workers)
+        self._queue = self.backend.Queue()
+        self._lock = self.backend.Lock()
+        self._workers = 0
+        self._shutdown = False
+
+    def submit(self, fn, *args, **kwargs):
+        """ schedule fn(*args, **kwargs) and return a `Future` """
+        if self._shutdown:
+            raise RuntimeError("cannot submit a job after shutdown")
+
+        future = Future(self.backend.Event, self.backend.Lock)
+        with self._lock:
+            self._queue.put((future, fn, args, kwargs))
+            if self._workers < self.max_workers:
+                self._workers += 1
+                self.backend.spawn(self._work)
+        return future
+
+    def shutdown(self):
+        """ stop the workers once all submitted jobs are done """
+        with self._lock:
+            self._shutdown = True
+            for i in range(self._workers):
+                self._queue.put(None)
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                with self._lock:
+                    self._workers -= 1
+                return
+
+            future, fn, args, kwargs = item
+            try:
+                result = fn(*args, **kwargs)
+            except:
+                future.set_exception(sys.exc_info())
+            else:
+                future.set_result(result)
+
+
+def as_completed(futures, backend="thread"):
+    """ iterate over futures as they complete """
+    futures = list(futures)
+    queue = load_backend(backend).Queue()
+    for f in futures:
+        f.add_done_callback(queue.put)
+
+    for i in range(len(futures)):
+        yield queue.get()
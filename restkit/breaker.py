@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+"""
+restkit.breaker
+~~~~~~~~~~~~~~~
+
+Circuit breaker failing fast on hosts that keep failing instead of
+waiting for connect timeouts and retries.
+"""
+
+import logging
+import threading
+import time
+
+from restkit.errors import CircuitBreakerOpen
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+log = logging.getLogger(__name__)
+
+
+class HostCircuit(object):
+    """ state of the circuit for one (host, port) """
+
+    def __init__(self, key, max_failures=5, failure_rate=0.5,
+            min_requests=20, window=60, reset_timeout=30, half_open_max=1):
+        self.key = key
+        self.max_failures = max_failures
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.half_open_max = half_open_max
+
+        self._state = CLOSED
+        self._opened_at = None
+        self._trials = 0
+        self._trial_started = None
+        self._window_start = time.time()
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def _set_state(self, state):
+        if state != self._state:
+            log.warning("circuit %s:%s is %s" % (self.key[0], self.key[1],
+                state))
+        self._state = state
+        if state == OPEN:
+            self._opened_at = time.time()
+        elif state == HALF_OPEN:
+            self._trials = 0
+        else:
+            self._reset_window()
+            self.consecutive_failures = 0
+
+    def _reset_window(self):
+        self._window_start = time.time()
+        self.requests = 0
+        self.failures = 0
+
+    @property
+    def state(self):
+        if self._state == OPEN and \
+                time.time() - self._opened_at >= self.reset_timeout:
+            self._set_state(HALF_OPEN)
+        return self._state
+
+    def allow(self):
+        """ return True if a request can be sent to the host """
+        with self._lock:
+            state = self.state
+            if state == CLOSED:
+                return True
+            elif state == HALF_OPEN:
+                # trials whose result was never recorded are given up
+                # after reset_timeout.
+                if self._trials >= self.half_open_max and \
+                        time.time() - self._trial_started >= \
+                        self.reset_timeout:
+                    self._trials = 0
+                if self._trials < self.half_open_max:
+                    self._trials += 1
+                    self._trial_started = time.time()
+                    return True
+            self.rejected += 1
+            return False
+
+    def release_trial(self):
+        """ give back the trial of a request that ended without a result,
+        like a request failing before it was sent """
+        with self._lock:
+            if self._state == HALF_OPEN and self._trials > 0:
+                self._trials -= 1
+
+    def record_success(self):
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._set_state(CLOSED)
+            self._record(False)
+
+    def record_failure(self):
+        with self._lock:
+            state = self.state
+            self._record(True)
+            if state == HALF_OPEN:
+                self._set_state(OPEN)
+            elif state == CLOSED and self._should_trip():
+                self._set_state(OPEN)
+
+    def _record(self, failed):
+        if time.time() - self._window_start > self.window:
+            self._reset_window()
+        self.requests += 1
+        if failed:
+            self.failures += 1
+            self.consecutive_failures += 1
+        else:
+            self.consecutive_failures = 0
+
+    def _should_trip(self):
+        if self.max_failures and \
+                self.consecutive_failures >= self.max_failures:
+            return True
+        return self.requests >= self.min_requests and \
+                self.failures >= self.failure_rate * self.requests
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "requests": self.requests,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "rejected": self.rejected
+        }
+
+
+class CircuitBreaker(object):
+    """ per (host, port) circuit breaker used by the client.
+
+    A circuit opens after `max_failures` consecutive failures or when
+    `failure_rate` of at least `min_requests` requests failed in the last
+    `window` seconds. While it's open requests fail immediately with
+    `CircuitBreakerOpen`. After `reset_timeout` seconds the circuit is
+    half-open: `half_open_max` requests are let through, it closes on
+    success and opens again on failure. Trials without result are let
+    through again after `reset_timeout`.
+
+    Only connection errors and `failure_statuses` are failures, errors
+    raised before the request is sent, like an invalid body or
+    `PoolTimeout`, aren't counted.
+
+    :param failure_statuses: status codes counted as failures, for
+    example (502, 503, 504).
+    """
+
+    def __init__(self, max_failures=5, failure_rate=0.5, min_requests=20,
+            window=60, reset_timeout=30, half_open_max=1,
+            failure_statuses=()):
+        self.options = dict(max_failures=max_failures,
+                failure_rate=failure_rate, min_requests=min_requests,
+                window=window, reset_timeout=reset_timeout,
+                half_open_max=half_open_max)
+        self.failure_statuses = failure_statuses
+        self._circuits = {}
+        self._lock = threading.Lock()
+
+    def get(self, addr):
+        try:
+            return self._circuits[addr]
+        except KeyError:
+            with self._lock:
+                if addr not in self._circuits:
+                    self._circuits[addr] = HostCircuit(addr, **self.options)
+                return self._circuits[addr]
+
+    def before_request(self, addr):
+        """ raise `CircuitBreakerOpen` if the circuit of addr is open """
+        if not self.get(addr).allow():
+            raise CircuitBreakerOpen("circuit open for %s:%s" % addr)
+
+    def record(self, addr, success):
+        if success:
+            self.get(addr).record_success()
+        else:
+            self.get(addr).record_failure()
+
+    def release(self, addr):
+        """ a request allowed by `before_request` ended without telling
+        anything about the host """
+        self.get(addr).release_trial()
+
+    def record_response(self, addr, status_int):
+        self.record(addr, status_int not in self.failure_statuses)
+
+    def state(self, host, port):
+        return self.get((host, port)).state
+
+    def stats(self):
+        """ return the state and counters of all circuits, by
+        "host:port" """
+        return dict([("%s:%s" % key, c.stats()) for key, c in \
+                self._circuits.items()])
@@ -2,22 +2,18 @@
 #
 # This file is part of restkit released under the MIT license.
 # See the NOTICE for more information.
-import base64
-import errno
+import io
 import logging
-import os
-import time
 import socket
-import ssl
+from io import BytesIO
+import time
 import traceback
 import types
-import urlparse
 
 try:
     from http_parser.http import (
             HttpStream, BadStatusLine, NoMoreData
     )
-    from http_parser.reader import SocketReader
 except ImportError:
     raise ImportError("""http-parser isn't installed or out of data.
 
@@ -25,19 +21,30 @@ except ImportError:
 
 from restkit import __version__
 
-from restkit.conn import Connection
+from restkit.batch import Executor, as_completed
+from restkit.conn import Connection, CHUNK_SIZE, STALE_CHECK_AFTER, \
+chunk_buffers
+from restkit.pool import ConnectionPool
+from restkit.proxy import ProxyConfig
 from restkit.errors import RequestError, RequestTimeout, RedirectLimit, \
-ProxyError
+CircuitBreakerOpen
+from restkit.hooks import make_hooks, add_hook, remove_hook, emit
+from restkit.retry import RetryPolicy
 from restkit.session import get_session
-from restkit.util import parse_netloc, rewrite_location, to_bytestring
-from restkit.wrappers import Request, Response
+from restkit.util import rewrite_location, to_bytestring
+from restkit.wrappers import Request, Response, Timings
 
 MAX_CLIENT_TIMEOUT=300
 MAX_CLIENT_CONNECTIONS = 5
 MAX_CLIENT_TRIES =3
 CLIENT_WAIT_TRIES = 0.3
 MAX_FOLLOW_REDIRECTS = 5
+MAX_PIPELINE_DEPTH = 16
+PIPELINE_METHODS = ('GET', 'DELETE', 'OPTIONS',)
 USER_AGENT = "restkit/%s" % __version__
+HTTP_VERSIONS = {(1, 1): "HTTP/1.1", (1, 0): "HTTP/1.0"}
+STATIC_HEADERS = ('host', 'user-agent', 'accept-encoding',)
+MAX_HEADERS_CACHE = 1000
 
 log = logging.getLogger(__name__)
 
@@ -76,10 +83,23 @@ class Client(object):
             response_class=None,
             timeout=None,
             use_proxy=False,
+            proxies=None,
+            no_proxy=None,
             max_tries=3,
             wait_tries=0.3,
             pool_size=10,
+            max_per_host=None,
+            max_connecting=None,
+            pool_timeout=None,
+            idle_timeout=None,
+            max_lifetime=None,
             backend="thread",
+            retry_policy=None,
+            circuit_breaker=None,
+            resolver=None,
+            ssl_context=None,
+            hooks=None,
+            stale_check_after=STALE_CHECK_AFTER,
             **ssl_args):
         """
         Client parameters
@@ -107,11 +127,53 @@ class Client(object):
         :param timeout: the default timeout of the connection
         (SO_TIMEOUT)
 
+        :param use_proxy: use the proxies set in the http_proxy and
+        https_proxy environment variables, except for the hosts in
+        NO_PROXY.
+        :param proxies: dict of url scheme to proxy url, used instead of the
+        environment variables.
+        :param no_proxy: list or comma separated string of hosts, domains
+        or CIDR networks reached without proxy, used instead of NO_PROXY.
+
         :param max_tries: the number of tries before we give up a
         connection
         :param wait_tries: number of time we wait between each tries.
         :attr pool_size: int, default 10. Maximum number of connections we
         keep in the default pool.
+        :param max_per_host: int, maximum number of connections opened to
+        a host. Requests over the limit wait for a connection to be
+        released.
+        :param max_connecting: int, maximum number of connections being
+        established at the same time to a host.
+        :param pool_timeout: time in seconds a request waits for a
+        connection when a limit is reached before `PoolTimeout` is
+        raised. None means wait forever.
+        :param idle_timeout: time in seconds an idle connection is kept in
+        the pool. Set it below the keep-alive timeout of the servers.
+        :param max_lifetime: time in seconds after which a connection is
+        closed instead of being reused. By default 600.
+
+        When one of the pool options above is set the client uses its own
+        pool instead of the global one.
+        :param retry_policy: `restkit.retry.RetryPolicy` instance deciding
+        when a request is retried. By default connection errors are
+        retried `max_tries` times waiting `wait_tries` between each tries.
+        :param circuit_breaker: `restkit.breaker.CircuitBreaker` instance.
+        Requests to a host whose circuit is open fail immediately with
+        `CircuitBreakerOpen`. It can be shared between clients.
+        :param resolver: `restkit.resolver.Resolver` instance caching DNS
+        lookups of new connections. By default the resolver of the
+        backend is used.
+        :param ssl_context: `ssl.SSLContext` used by the HTTPS
+        connections. By default one context is built for each set of
+        ssl_args and shared by all the connections using them.
+        :param stale_check_after: time in seconds a pooled connection can
+        be idle and still be reused without checking the socket. Older
+        connections are checked with a non-blocking peek. None never
+        checks them.
+        :param hooks: dict of event name to a function or a list of
+        functions called during the lifecycle of a request. See
+        `restkit.hooks` for the events.
         :param ssl_args: named argument, see ssl module for more
         informations
         """
@@ -122,7 +184,10 @@ class Client(object):
         self.filters = filters or []
         self.max_status_line_garbage = max_status_line_garbage
         self.max_header_count = max_header_count
-        self.use_proxy = use_proxy
+        self.use_proxy = use_proxy or proxies is not None
+        self.proxy_config = None
+        if self.use_proxy:
+            self.proxy_config = ProxyConfig(proxies, no_proxy)
 
         self.request_filters = []
         self.response_filters = []
@@ -137,9 +202,24 @@ class Client(object):
                 retry_max = max_tries,
                 timeout = timeout)
 
+        # options of restkit.pool.ConnectionPool, they apply to this client
+        # only.
+        pool_options = dict(
+                max_per_host = max_per_host,
+                max_connecting = max_connecting,
+                pool_timeout = pool_timeout,
+                idle_timeout = idle_timeout,
+                max_lifetime = max_lifetime)
+        pool_options = dict([(k, v) for k, v in pool_options.items() \
+                if v is not None])
 
         if pool is None:
-            pool = get_session(backend, **session_options)
+            if not pool_options:
+                pool = get_session(backend, **session_options)
+            else:
+                session_options.update(pool_options)
+                pool = ConnectionPool(factory=Connection, backend=backend,
+                        **session_options)
         self._pool = pool
         self.backend = backend
 
@@ -149,10 +229,15 @@ class Client(object):
 
         self.max_tries = max_tries
         self.wait_tries = wait_tries
+        if retry_policy is None:
+            retry_policy = RetryPolicy(max_tries=max_tries,
+                    backoff=wait_tries)
+        self.retry_policy = retry_policy
+        self.circuit_breaker = circuit_breaker
+        self.resolver = resolver
         self.pool_size = pool_size
         self.timeout = timeout
 
-        self._nb_redirections = self.max_follow_redirect
         self._url = None
         self._initial_url = None
         self._write_cb = None
@@ -164,6 +249,11 @@ class Client(object):
         self.method = 'GET'
         self.body = None
         self.ssl_args = ssl_args or {}
+        self.ssl_context = ssl_context
+        self.hooks = make_hooks(hooks)
+        self.stale_check_after = stale_check_after
+        self._executor = None
+        self._headers_cache = {}
 
     def load_filters(self):
         """ Populate filters from self.filters.
@@ -179,116 +269,185 @@ class Client(object):
 
     def get_connection(self, request):
         """ get a connection from the pool or create new one. """
-
-        addr = parse_netloc(request.parsed_url)
-        is_ssl = request.is_ssl()
-
-        extra_headers = []
-        conn = None
-        if self.use_proxy:
-            conn = self.proxy_connection(request,
-                    addr, is_ssl)
-        if not conn:
-            conn = self._pool.get(host=addr[0], port=addr[1],
-                    pool=self._pool, is_ssl=is_ssl,
-                    extra_headers=extra_headers, **self.ssl_args)
-
-
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.before_request(request.parsed_url.addr)
+
+        options, extra_headers = self.connection_options(request)
+        conn = self._pool.get(**options)
+
+        # connections are shared between clients, use the headers and
+        # hooks of this one until the connection is released.
+        conn.extra_headers = extra_headers
+        conn.hooks = self.hooks
+        if self.hooks:
+            emit(self.hooks, 'pool_checkout', request, conn)
         return conn
 
-    def proxy_connection(self, request, req_addr, is_ssl):
-        """ do the proxy connection """
-        proxy_settings = os.environ.get('%s_proxy' %
-                request.parsed_url.scheme)
-
-        if proxy_settings and proxy_settings is not None:
-            request.is_proxied = True
-
-            proxy_settings, proxy_auth =  _get_proxy_auth(proxy_settings)
-            addr = parse_netloc(urlparse.urlparse(proxy_settings))
-
-            if is_ssl:
-                if proxy_auth:
-                    proxy_auth = 'Proxy-authorization: %s' % proxy_auth
-                proxy_connect = 'CONNECT %s:%s HTTP/1.0\r\n' % req_addr
-
-                user_agent = request.headers.iget('user_agent')
-                if not user_agent:
-                    user_agent = "User-Agent: restkit/%s\r\n" % __version__
-
-                proxy_pieces = '%s%s%s\r\n' % (proxy_connect, proxy_auth,
-                        user_agent)
-
-
-                conn = self._pool.get(host=addr[0], port=addr[1],
-                    pool=self._pool, is_ssl=is_ssl,
-                    extra_headers=[], **self.ssl_args)
-
-
-                conn.send(proxy_pieces)
-                p = HttpStream(SocketReader(conn.socket()), kind=1,
-                    decompress=True)
-
-                if p.status_code != 200:
-                    raise ProxyError("Tunnel connection failed: %d %s" %
-                            (p.status_code(), p.body_string()))
-                # read body
-                p.body_string()
-
-            else:
-                headers = []
-                if proxy_auth:
-                    headers = [('Proxy-authorization', proxy_auth)]
-
-                conn = self._pool.get(host=addr[0], port=addr[1],
-                        pool=self._pool, is_ssl=False,
-                        extra_headers=[], **self.ssl_args)
-            return conn
-
-        return
+    def connection_options(self, request):
+        """ return the options given to the pool to get a connection for
+        request, and the extra headers sent with the request. """
+        addr = request.parsed_url.addr
+        is_ssl = request.is_ssl()
+        options = dict(host=addr[0], port=addr[1], pool=self._pool,
+                is_ssl=is_ssl, extra_headers=[], resolver=self.resolver,
+                ssl_context=self.ssl_context, hooks=self.hooks,
+                stale_check_after=self.stale_check_after)
+        options.update(self.ssl_args)
+
+        proxy = None
+        if self.proxy_config is not None:
+            proxy = self.proxy_config.get(request.parsed_url.scheme,
+                    addr[0], addr[1])
+        if proxy is None:
+            return options, []
+
+        options.update(host=proxy.addr[0], port=proxy.addr[1])
+        if is_ssl:
+            # the tunnel is opened with the connection and kept with it
+            # in the pool, connections are matched on the tunnel.
+            user_agent = request.headers.iget('user-agent') or USER_AGENT
+            tunnel_headers = [('User-Agent', user_agent)]
+            if proxy.authorization:
+                tunnel_headers.append(('Proxy-Authorization',
+                    proxy.authorization))
+            options.update(tunnel=addr, tunnel_headers=tunnel_headers)
+            return options, []
+
+        request.is_proxied = True
+        options['is_ssl'] = False
+        headers = []
+        if proxy.authorization:
+            headers = [('Proxy-Authorization', proxy.authorization)]
+        return options, headers
+
+    def add_hook(self, event, fn):
+        """ call fn on event, see `restkit.hooks` for the events and
+        their arguments """
+        add_hook(self.hooks, event, fn)
+
+    def remove_hook(self, event, fn):
+        remove_hook(self.hooks, event, fn)
+
+    def pool_stats(self):
+        """ return the statistics of the connection pool, see
+        `restkit.pool.ConnectionPool.stats`. None if the pool doesn't
+        keep statistics. """
+        stats = getattr(self._pool, 'stats', None)
+        if stats is None:
+            return None
+        return stats()
+
+    def warmup(self, urls, per_host=1, concurrency=None):
+        """ open `per_host` keep-alive connections to the hosts of urls
+        and park them in the pool, so the first requests don't pay the
+        connection setup. The pool keeps at most `pool_size` idle
+        connections and `max_per_host` connections per host.
+
+        :param urls: list of urls. Only their host is used.
+        :param per_host: int, number of connections to open per host.
+        :param concurrency: int, maximum number of connections opened at
+        the same time. By default `pool_size`.
+
+        Return the list of (url, exception) for connections that
+        couldn't be opened.
+        """
+        requests = {}
+        for url in urls:
+            request = Request(url)
+            key = request.parsed_url.pool_key
+            requests.setdefault(key, request)
+
+        max_per_host = getattr(self._pool, 'max_per_host', None)
+        if max_per_host is not None:
+            per_host = min(per_host, max_per_host)
+
+        executor = Executor(self._pool.backend_mod,
+                max_workers=concurrency or self.pool_size)
+        futures = []
+        for request in requests.values():
+            options, _ = self.connection_options(request)
+            for i in range(per_host):
+                futures.append((request.url,
+                    executor.submit(self._open_connection, options)))
+        executor.shutdown()
+
+        failures = []
+        for url, f in futures:
+            error = f.exception()
+            if error is not None:
+                log.warning("warmup of %s failed: %s" % (url, str(error)))
+                failures.append((url, error))
+        return failures
+
+    def _open_connection(self, options):
+        """ open a new connection and release it to the pool """
+        connect = getattr(self._pool, 'connect', None)
+        if connect is not None:
+            conn = connect(**dict(options))
+        else:
+            options = dict(options)
+            options.update(self._pool.options)
+            conn = self._pool.factory(**options)
+        if conn is not None:
+            conn.release()
 
     def make_headers_string(self, request, extra_headers=None):
-        """ create final header string """
-        headers = request.headers.copy()
-        if extra_headers is not None:
-            for k, v in extra_headers:
-                headers[k] = v
-
+        """ create final header string. The Host, User-Agent and
+        Accept-Encoding lines are built once and cached, only the other
+        headers are serialized for each request. """
+        extra_headers = list(extra_headers or [])
         if not request.body and request.method in ('POST', 'PUT',):
-            headers['Content-Length'] = 0
-
-        if self.version == (1,1):
-            httpver = "HTTP/1.1"
-        else:
-            httpver = "HTTP/1.0"
-
-        ua = headers.iget('user_agent')
-        if not ua:
-            ua = USER_AGENT
-        host = request.host
+            extra_headers.append(('Content-Length', 0))
 
+        headers = request.headers
+        ua = headers.iget('user-agent')
         accept_encoding = headers.iget('accept-encoding')
-        if not accept_encoding:
-            accept_encoding = 'identity'
+        host = headers.iget('host')
+
+        # extra headers replace the headers of the request
+        exclude = set(STATIC_HEADERS)
+        lextra = []
+        for k, v in extra_headers:
+            lkey = k.lower()
+            if lkey in STATIC_HEADERS:
+                if lkey == "user-agent":
+                    ua = ua or v
+                elif lkey == "accept-encoding":
+                    accept_encoding = accept_encoding or v
+                else:
+                    host = host or v
+                continue
+            exclude.add(lkey)
+            lextra.append("%s: %s\r\n" % (k, str(v)))
+        lheaders = [headers.serialize(exclude)] + lextra
+
+        if not host:
+            host = request.parsed_url.host_header
+
+        key = (host, ua or USER_AGENT, accept_encoding or 'identity')
+        try:
+            static_headers = self._headers_cache[key]
+        except KeyError:
+            if len(self._headers_cache) >= MAX_HEADERS_CACHE:
+                self._headers_cache.clear()
+            static_headers = self._headers_cache[key] = (
+                    "Host: %s\r\nUser-Agent: %s\r\n"
+                    "Accept-Encoding: %s\r\n" % key)
 
         if request.is_proxied:
-            full_path = ("https://" if request.is_ssl() else "http://") + request.host + request.path
+            full_path = ("https://" if request.is_ssl() else "http://") + \
+                    host + request.path
         else:
             full_path = request.path
 
-        lheaders = [
-            "%s %s %s\r\n" % (request.method, full_path, httpver),
-            "Host: %s\r\n" % host,
-            "User-Agent: %s\r\n" % ua,
-            "Accept-Encoding: %s\r\n" % accept_encoding
-        ]
+        request_line = "%s %s %s\r\n" % (request.method, full_path,
+                HTTP_VERSIONS.get(self.version, "HTTP/1.0"))
 
-        lheaders.extend(["%s: %s\r\n" % (k, str(v)) for k, v in \
-                headers.items() if k.lower() not in \
-                ('user-agent', 'host', 'accept-encoding',)])
         if log.isEnabledFor(logging.DEBUG):
-            log.debug("Send headers: %s" % lheaders)
-        return "%s\r\n" % "".join(lheaders)
+            log.debug("Send headers: %s" % ([request_line,
+                static_headers] + lheaders))
+        return "%s%s%s\r\n" % (request_line, static_headers,
+                "".join(lheaders))
 
     def perform(self, request):
         """ perform the request. If an error happen it will first try to
@@ -297,12 +456,17 @@ class Client(object):
         if log.isEnabledFor(logging.DEBUG):
             log.debug("Start to perform request: %s %s %s" %
                     (request.host, request.method, request.path))
+        self.retry_policy.on_request(request)
         tries = 0
         while True:
             conn = None
+            resp = None
+            timings = request.timings = Timings(retries=tries,
+                    redirects=request.redirects)
             try:
                 # get or create a connection to the remote host
                 conn = self.get_connection(request)
+                timings.set_connection(conn)
 
                 # send headers
                 msg = self.make_headers_string(request,
@@ -325,7 +489,9 @@ class Client(object):
                             hdr_expect.lower() == "100-continue":
                         conn.send(msg)
                         msg = None
-                        p = HttpStream(SocketReader(conn.socket()), kind=1,
+                        if self.hooks:
+                            emit(self.hooks, 'headers_sent', request, conn)
+                        p = HttpStream(conn.reader(), kind=1,
                                 decompress=True)
 
 
@@ -341,14 +507,27 @@ class Client(object):
 
 
                     if isinstance(request.body, types.StringTypes):
+                        # small requests are sent in one write, large
+                        # bodies are not copied to join them with the
+                        # headers.
+                        body = to_bytestring(request.body)
+                        buffers = []
                         if msg is not None:
-                            conn.send(msg + to_bytestring(request.body),
-                                    chunked)
+                            buffers.append(msg)
+                        if chunked:
+                            buffers.extend(chunk_buffers(body) +
+                                    chunk_buffers(""))
                         else:
-                            conn.send(to_bytestring(request.body), chunked)
+                            buffers.append(body)
+                        conn.sendv(buffers)
+                        if self.hooks and msg is not None:
+                            emit(self.hooks, 'headers_sent', request, conn)
                     else:
                         if msg is not None:
                             conn.send(msg)
+                            if self.hooks:
+                                emit(self.hooks, 'headers_sent', request,
+                                        conn)
 
                         if hasattr(request.body, 'read'):
                             if hasattr(request.body, 'seek'):
@@ -356,42 +535,64 @@ class Client(object):
                             conn.sendfile(request.body, chunked)
                         else:
                             conn.sendlines(request.body, chunked)
-                    if chunked:
-                        conn.send_chunk("")
+                        if chunked:
+                            conn.send_chunk("")
+
+                    if self.hooks:
+                        emit(self.hooks, 'body_sent', request, conn)
                 else:
                     conn.send(msg)
+                    if self.hooks:
+                        emit(self.hooks, 'headers_sent', request, conn)
+                timings.mark('send')
+
+                resp = self.get_response(request, conn)
+                self.circuit_result(request, resp)
+                if not request.can_rewind() or not \
+                        self.retry_policy.should_retry_response(request,
+                                resp, tries):
+                    return resp
 
-                return self.get_response(request, conn)
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug("retry on status: %s" % resp.status)
+                delay = self.retry_policy.get_backoff(tries, resp)
+                resp.skip_body()
             except socket.gaierror, e:
+                self.circuit_result(request)
                 if conn is not None:
                     conn.release(True)
                 raise RequestError(str(e))
             except socket.timeout, e:
+                self.circuit_result(request)
                 if conn is not None:
                     conn.release(True)
                 raise RequestTimeout(str(e))
             except socket.error, e:
+                self.circuit_result(request)
                 if log.isEnabledFor(logging.DEBUG):
                     log.debug("socket error: %s" % str(e))
                 if conn is not None:
-                    conn.close()
+                    conn.release(True)
 
-                errors = (errno.EAGAIN, errno.EPIPE, errno.EBADF,
-                        errno.ECONNRESET)
-                if e[0] not in errors or tries >= self.max_tries:
+                if not self.retry_policy.should_retry_error(request, e,
+                        tries):
                     raise RequestError("socket.error: %s" % str(e))
 
                 # should raised an exception in other cases
                 request.maybe_rewind(msg=str(e))
-
+                delay = self.retry_policy.get_backoff(tries)
             except NoMoreData, e:
+                self.circuit_result(request)
                 if conn is not None:
                     conn.release(True)
 
                 request.maybe_rewind(msg=str(e))
-                if tries >= self.max_tries:
+                if not self.retry_policy.should_retry_error(request, e,
+                        tries):
                     raise
-            except BadStatusLine:
+                delay = self.retry_policy.get_backoff(tries)
+            except BadStatusLine, e:
+                self.circuit_result(request)
 
                 if conn is not None:
                     conn.release(True)
@@ -399,41 +600,293 @@ class Client(object):
                 # should raised an exception in other cases
                 request.maybe_rewind(msg="bad status line")
 
-                if tries >= self.max_tries:
+                if not self.retry_policy.should_retry_error(request, e,
+                        tries):
                     raise
+                delay = self.retry_policy.get_backoff(tries)
+            except CircuitBreakerOpen:
+                raise
             except Exception:
                 # unkown error
                 log.debug("unhandled exception %s" %
                         traceback.format_exc())
+                if resp is None:
+                    self.circuit_release(request)
                 if conn is not None:
                     conn.release(True)
 
                 raise
             tries += 1
-            self._pool.backend_mod.sleep(self.wait_tries)
-
-    def request(self, url, method='GET', body=None, headers=None):
-        """ perform immediatly a new request """
+            if self.hooks:
+                emit(self.hooks, 'retry', request, tries, delay)
+            self._pool.backend_mod.sleep(delay)
+
+    def circuit_result(self, request, response=None):
+        """ report the result of a request to the circuit breaker. No
+        response means the request failed. """
+        if self.circuit_breaker is None:
+            return
+
+        addr = request.parsed_url.addr
+        if response is None:
+            self.circuit_breaker.record(addr, False)
+        else:
+            self.circuit_breaker.record_response(addr, response.status_int)
 
-        request = Request(url, method=method, body=body,
-                headers=headers)
+    def circuit_release(self, request):
+        """ tell the circuit breaker the request ended with an error
+        that isn't a failure of the host """
+        if self.circuit_breaker is not None:
+            self.circuit_breaker.release(request.parsed_url.addr)
 
-        # apply request filters
-        # They are applied only once time.
+    def filter_request(self, request):
+        """ apply request filters. They are applied only once time.
+        If a filter return a response, it is returned. """
         for f in self.request_filters:
             ret = f.on_request(request)
             if isinstance(ret, Response):
                 # a response instance has been provided.
-                # just return it. Useful for cache filters
+                # just return it. Useful for cache filters. Nothing was
+                # sent, its timings have no phase.
+                if ret.timings is None:
+                    ret.timings = Timings(redirects=request.redirects)
                 return ret
+        return None
+
+    def request(self, url, method='GET', body=None, headers=None):
+        """ perform immediatly a new request """
+
+        request = Request(url, method=method, body=body,
+                headers=headers)
+
+        ret = self.filter_request(request)
+        if ret is not None:
+            return ret
 
         # no response has been provided, do the request
-        self._nb_redirections = self.max_follow_redirect
         return self.perform(request)
 
+    @property
+    def executor(self):
+        """ executor used by `submit`. It runs at most `pool_size`
+        requests at a time on threads or greenlets depending on the
+        backend. """
+        if self._executor is None:
+            self._executor = Executor(self._pool.backend_mod,
+                    max_workers=self.pool_size)
+        return self._executor
+
+    def submit(self, url, method='GET', body=None, headers=None):
+        """ perform a request in the background and return a
+        `restkit.batch.Future`. Its result is the response, or the error
+        raised by the request. The body is read in the background and
+        kept in memory, so the connection is released when the request
+        is done. """
+        return self.executor.submit(self._read_request, url,
+                method=method, body=body, headers=headers)
+
+    def _read_request(self, url, **kwargs):
+        """ perform a request and read its body, releasing the connection
+        before the response is returned """
+        resp = self.request(url, **kwargs)
+        body = resp.body_string()
+        resp._body = BytesIO(body)
+        resp._already_read = False
+        resp.connection = DetachedConnection()
+        return resp
+
+    def map(self, requests, concurrency=None, ordered=False):
+        """ perform a batch of requests with at most `concurrency`
+        requests running at the same time.
+
+        :param requests: iterable of urls or of dicts of `request`
+        arguments (url, method, body, headers).
+        :param concurrency: int, by default `pool_size`.
+        :param ordered: if True futures are returned in the order of the
+        requests, else they are returned as they complete.
+
+        Return an iterator over `restkit.batch.Future` instances. Errors
+        are collected in the futures, use `Future.exception` or
+        `Future.result` to get them. Like with `submit` the bodies are
+        read in memory, so no more than `concurrency` connections are
+        used.
+        """
+        executor = Executor(self._pool.backend_mod,
+                max_workers=concurrency or self.pool_size)
+
+        futures = []
+        for req in requests:
+            if isinstance(req, basestring):
+                req = {'url': req}
+            futures.append(executor.submit(self._read_request, **req))
+        executor.shutdown()
+
+        if ordered:
+            return iter(futures)
+        return as_completed(futures, backend=self._pool.backend_mod)
+
+    def pipeline(self, requests, max_depth=MAX_PIPELINE_DEPTH):
+        """ perform a batch of requests using HTTP/1.1 pipelining.
+
+        Idempotent requests without body (see PIPELINE_METHODS) going to
+        the same host are sent back-to-back on one keep-alive connection
+        and their responses are parsed in order. Other requests are
+        performed one after the other. If the server close the connection
+        before answering all the requests, the unanswered ones are sent
+        again on a new connection.
+
+        :param requests: list of urls or `restkit.wrappers.Request`
+        instances.
+        :param max_depth: maximum number of requests sent on a connection
+        before reading the responses.
+
+        Return the list of responses in the order of the requests. The
+        body of pipelined responses is already read so the connection
+        can be reused by the next request.
+        """
+        responses = [None] * len(requests)
+        batches = {}
+        keys = []
+        for i, request in enumerate(requests):
+            if not isinstance(request, Request):
+                request = Request(request)
+
+            ret = self.filter_request(request)
+            if ret is not None:
+                responses[i] = ret
+                continue
+
+            if request.method not in PIPELINE_METHODS or \
+                    request.body is not None or self.use_proxy:
+                responses[i] = self.perform(request)
+                continue
+
+            key = request.parsed_url.pool_key
+            if key not in batches:
+                batches[key] = []
+                keys.append(key)
+            batches[key].append((i, request))
+
+        for key in keys:
+            for i, resp in self.perform_pipeline(batches[key], max_depth):
+                responses[i] = resp
+        return responses
+
+    def perform_pipeline(self, batch, max_depth=MAX_PIPELINE_DEPTH):
+        """ pipeline a list of (index, request) to the same host. Return
+        a list of (index, response). """
+        results = []
+        tries = 0
+        depth = max(1, max_depth)
+        while batch:
+            conn = None
+            done = 0
+            pending = batch[:depth]
+            for _, request in pending:
+                request.timings = Timings(retries=tries,
+                        redirects=request.redirects)
+            try:
+                conn = self.get_connection(pending[0][1])
+                # the setup of a new connection is counted in the timings
+                # of the first request.
+                for _, request in pending:
+                    request.timings.set_connection(conn)
+
+                conn.send("".join([self.make_headers_string(request,
+                    conn.extra_headers) for _, request in pending]))
+                for _, request in pending:
+                    request.timings.mark('send')
+                    if self.hooks:
+                        emit(self.hooks, 'headers_sent', request, conn)
+
+                reader = PipelineReader(conn)
+                should_close = False
+                for i, request in pending:
+                    p = HttpStream(reader, kind=1,
+                            decompress=self.decompress)
+                    reader.attach(p.parser)
+
+                    headers = p.headers()
+                    request.timings.set_response(reader.first_byte)
+                    if self.hooks:
+                        emit(self.hooks, 'response_headers', request,
+                                p.status_code(), headers)
+
+                    resp = self.response_class(
+                            DetachedConnection(self.hooks), request, p)
+                    # read the full body so the next response can be
+                    # parsed.
+                    resp._body = BytesIO(resp._body.read())
+                    request.timings.mark('body')
+                    self.circuit_result(request, resp)
+                    results.append((i, resp))
+                    done += 1
+
+                    if resp.should_close:
+                        should_close = True
+                        break
+
+                conn.release(should_close)
+            except socket.gaierror, e:
+                self.circuit_result(pending[0][1])
+                if conn is not None:
+                    conn.release(True)
+                raise RequestError(str(e))
+            except socket.timeout, e:
+                self.circuit_result(pending[0][1])
+                if conn is not None:
+                    conn.release(True)
+                raise RequestTimeout(str(e))
+            except (socket.error, NoMoreData, BadStatusLine), e:
+                self.circuit_result(pending[0][1])
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug("pipeline error: %s" % str(e))
+                if conn is not None:
+                    conn.release(True)
+
+                if not done:
+                    # the server may not support pipelining, send the
+                    # remaining requests one at a time.
+                    depth = 1
+                    if not self.retry_policy.should_retry_error(
+                            pending[0][1], e, tries):
+                        if isinstance(e, socket.error):
+                            raise RequestError("socket.error: %s" % str(e))
+                        raise
+                    delay = self.retry_policy.get_backoff(tries)
+                    tries += 1
+                    if self.hooks:
+                        emit(self.hooks, 'retry', pending[0][1], tries,
+                                delay)
+                    self._pool.backend_mod.sleep(delay)
+            except CircuitBreakerOpen:
+                raise
+            except Exception:
+                log.debug("unhandled exception %s" %
+                        traceback.format_exc())
+                if not done:
+                    self.circuit_release(pending[0][1])
+                if conn is not None:
+                    conn.release(True)
+                raise
+
+            batch = batch[done:]
+
+        for idx, (i, resp) in enumerate(results):
+            if self.follow_redirect and \
+                    resp.status_int in (301, 302, 307,) and \
+                    (resp.request.method in ('GET', 'HEAD',) or \
+                        self.force_follow_redirect):
+                results[idx] = (i, self.redirect(resp.location,
+                    resp.request))
+            else:
+                for f in self.response_filters:
+                    f.on_response(resp, resp.request)
+        return results
+
     def redirect(self, location, request):
         """ reset request, set new url of request and perform it """
-        if self._nb_redirections <= 0:
+        if request.redirects >= self.max_follow_redirect:
             raise RedirectLimit("Redirection limit is reached")
 
         if request.initial_url is None:
@@ -447,8 +900,10 @@ class Client(object):
 
         # change request url and method if needed
         request.url = location
+        if self.hooks:
+            emit(self.hooks, 'redirect', request, location)
 
-        self._nb_redirections -= 1
+        request.redirects += 1
 
         #perform a new request
         return self.perform(request)
@@ -459,14 +914,19 @@ class Client(object):
         if log.isEnabledFor(logging.DEBUG):
             log.debug("Start to parse response")
 
-        p = HttpStream(SocketReader(connection.socket()), kind=1,
-                decompress=self.decompress)
+        reader = connection.reader()
+        p = HttpStream(reader, kind=1, decompress=self.decompress)
 
         if log.isEnabledFor(logging.DEBUG):
             log.debug("Got response: %s %s" % (p.version(), p.status()))
             log.debug("headers: [%s]" % p.headers())
 
         location = p.headers().get('location')
+        if request.timings is not None:
+            request.timings.set_response(reader.first_byte)
+        if self.hooks:
+            emit(self.hooks, 'response_headers', request, p.status_code(),
+                    p.headers())
 
         if self.follow_redirect:
             should_close = not p.should_keep_alive()
@@ -510,27 +970,85 @@ class Client(object):
         return resp
 
 
-def _get_proxy_auth(proxy_settings):
-    proxy_username = os.environ.get('proxy-username')
-    if not proxy_username:
-        proxy_username = os.environ.get('proxy_username')
-    proxy_password = os.environ.get('proxy-password')
-    if not proxy_password:
-        proxy_password = os.environ.get('proxy_password')
-
-    proxy_password = proxy_password or ""
-
-    if not proxy_username:
-        u = urlparse.urlparse(proxy_settings)
-        if u.username:
-            proxy_password = u.password or proxy_password
-            proxy_settings = urlparse.urlunparse((u.scheme,
-                u.netloc.split("@")[-1], u.path, u.params, u.query,
-                u.fragment))
-
-    if proxy_username:
-        user_auth = base64.encodestring('%s:%s' % (proxy_username,
-                                    proxy_password))
-        return proxy_settings, 'Basic %s\r\n' % (user_auth.strip())
-    else:
-        return proxy_settings, ''
+class DetachedConnection(object):
+    """ connection used by responses whose body has already been read
+    from the socket, like the responses of a pipeline. """
+
+    def __init__(self, hooks=None):
+        self.hooks = hooks
+
+    def release(self, should_close=False):
+        pass
+
+
+class PipelineReader(io.RawIOBase):
+    """ socket reader that never gives the parser more than the
+    current message. Data of the next pipelined responses is kept in
+    the buffer until a new parser is attached. """
+
+    def __init__(self, sock):
+        io.RawIOBase.__init__(self)
+        self._sock = sock
+        self._buf = ""
+        self._remaining = None
+        self.parser = None
+        self.first_byte = None
+
+    def attach(self, parser):
+        """ parse the next response with parser """
+        self.parser = parser
+        self._remaining = None
+        self.first_byte = None
+
+    def readable(self):
+        return True
+
+    def _limit(self, size):
+        parser = self.parser
+        if not parser.is_headers_complete():
+            # headers are given line by line so we stop at the end of
+            # the headers.
+            idx = self._buf.find("\n", 0, size)
+            if idx >= 0:
+                return idx + 1
+            return size
+
+        if self._remaining is None:
+            clen = parser.get_headers().get('content-length')
+            if clen is not None and not parser.is_chunked():
+                self._remaining = int(clen)
+            else:
+                self._remaining = -1
+
+        if self._remaining >= 0:
+            return min(size, self._remaining)
+        elif parser.is_chunked():
+            # a chunked message always ends with a CRLF
+            idx = self._buf.find("\n", 0, size)
+            if idx >= 0:
+                return idx + 1
+        return size
+
+    def readinto(self, b):
+        if self.parser.is_message_complete():
+            return 0
+
+        if not self._buf:
+            self._buf = self._sock.recv(CHUNK_SIZE)
+            if not self._buf:
+                return 0
+
+        if self.first_byte is None:
+            # the data of a response may have been received with the
+            # previous one.
+            self.first_byte = time.time()
+            hooks = getattr(self._sock, 'hooks', None)
+            if hooks:
+                emit(hooks, 'first_byte', self._sock)
+
+        limit = self._limit(len(b))
+        data, self._buf = self._buf[:limit], self._buf[limit:]
+        if self._remaining > 0:
+            self._remaining -= len(data)
+        b[:len(data)] = data
+        return len(data)
@@ -3,52 +3,202 @@
 # This file is part of restkit released under the MIT license.
 # See the NOTICE for more information.
 
+import errno
 import logging
+import os
 import random
 import select
 import socket
-import ssl
+import stat
 import time
 
+try:
+    from os import sendfile
+except ImportError:
+    try:
+        # pysendfile, python < 3.3
+        from sendfile import sendfile
+    except ImportError:
+        sendfile = None
+
+from http_parser.http import HttpStream
+from http_parser.reader import SocketReader
 from socketpool import Connector
 from socketpool.util import is_connected
 
+from restkit import tls
+from restkit.errors import ProxyError
+from restkit.hooks import emit
+from restkit.resolver import DNS_TIMEOUT, get_resolver
+
+MSG_DONTWAIT = getattr(socket, 'MSG_DONTWAIT', None)
+
 CHUNK_SIZE = 16 * 1024
 MAX_BODY = 1024 * 112
-DNS_TIMEOUT = 60
 
+# connections idle for less than this time in seconds are reused without
+# checking the socket.
+STALE_CHECK_AFTER = 1.0
 
-class Connection(Connector):
+# consecutive buffers are joined before being sent as long as they
+# don't exceed this size, a full chunk and its framing are sent at once.
+MAX_COALESCE = 4 * CHUNK_SIZE
 
-    def __init__(self, host, port, backend_mod=None, pool=None,
-            is_ssl=False, extra_headers=[],  **ssl_args):
+# named arguments of Connection, the others are ssl arguments.
+CONNECTION_ARGS = ('host', 'port', 'backend_mod', 'pool', 'is_ssl',
+        'extra_headers', 'resolver', 'ssl_context', 'hooks',
+        'stale_check_after', 'tunnel', 'tunnel_headers',)
 
-        # connect the socket, if we are using an SSL connection, we wrap
-        # the socket.
-        self._s = backend_mod.Socket(socket.AF_INET, socket.SOCK_STREAM)
-        self._s.connect((host, port))
-        if is_ssl:
-            self._s = ssl.wrap_socket(self._s, **ssl_args)
+def ssl_identity(is_ssl, ssl_context, ssl_args):
+    """ return what a connection must share with the options of a
+    request to be reused for it """
+    if not is_ssl:
+        return None
+    return (ssl_context, tls.ssl_args_key(ssl_args))
+
+def chunk_buffers(data):
+    """ return the buffers of a chunk: size line, data and CRLF """
+    return ["%X\r\n" % len(data), data, "\r\n"]
 
 
+class Connection(Connector):
+
+    def __init__(self, host, port, backend_mod=None, pool=None,
+            is_ssl=False, extra_headers=[], resolver=None, ssl_context=None,
+            hooks=None, stale_check_after=STALE_CHECK_AFTER, tunnel=None,
+            tunnel_headers=None, **ssl_args):
         self.extra_headers = extra_headers
         self.is_ssl = is_ssl
         self.backend_mod = backend_mod
         self.host = host
         self.port = port
+        self.hooks = hooks
+        self.tunnel = tunnel
+        self.ssl_identity = ssl_identity(is_ssl, ssl_context, ssl_args)
+        self.stale_check_after = stale_check_after
+        if hooks:
+            emit(hooks, 'connect_start', host, port)
+
+        # connect the socket, if we are using an SSL connection, we wrap
+        # the socket.
+        resolver = resolver or get_resolver(backend_mod)
+        started = time.time()
+        addrs = resolver.resolve(host, port)
+        resolved = time.time()
+        try:
+            self._s = self._connect(addrs, backend_mod)
+        except socket.error:
+            # no cached address accepts connections, the host may have
+            # moved.
+            resolver.invalidate(host, port)
+            raise
+        self._s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        connected = time.time()
+        if hooks:
+            emit(hooks, 'connect_end', self)
+
+        if tunnel is not None:
+            # host and port are the ones of the proxy, tls is done with
+            # the remote host.
+            self._open_tunnel(tunnel, tunnel_headers)
+            host, port = tunnel
+
+        handshake = None
+        if is_ssl:
+            self._s = tls.wrap_socket(self._s, host, ssl_args, ssl_context)
+            handshake = time.time() - connected
+            if hooks:
+                emit(hooks, 'tls_done', self)
+
+        # durations of the dns lookup, connect and tls handshake, given to
+        # the timings of the first request.
+        self.setup_timings = (resolved - started, connected - resolved,
+                handshake)
+
         self._connected = True
         self._life =  time.time() - random.randint(0, 10)
+        self.last_used = time.time()
+        self.bytes_sent = 0
+        self.bytes_received = 0
         self._pool = pool
         self._released = False
 
+    def _open_tunnel(self, tunnel, headers=None):
+        """ ask the proxy to open a tunnel to the (host, port) tunnel """
+        lines = ["CONNECT %s:%s HTTP/1.1\r\n" % tunnel,
+                "Host: %s:%s\r\n" % tunnel]
+        lines.extend(["%s: %s\r\n" % header for header in headers or []])
+        lines.append("\r\n")
+        self._s.sendall("".join(lines))
+
+        # the proxy sends nothing after the headers until we talk to the
+        # remote host, so the parser doesn't read more than the response.
+        p = HttpStream(SocketReader(self._s), kind=1)
+        if p.status_code() != 200:
+            self._s.close()
+            raise ProxyError("tunnel connection to %s:%s failed: %s" %
+                    (tunnel[0], tunnel[1], p.status()))
+
+    def _connect(self, addrs, backend_mod):
+        """ connect to the first address accepting the connection """
+        error = None
+        for family, socktype, proto, _, sockaddr in addrs:
+            sock = backend_mod.Socket(family, socket.SOCK_STREAM)
+            try:
+                sock.connect(sockaddr)
+                return sock
+            except socket.error, e:
+                error = e
+                sock.close()
+        raise error or socket.error("no address to connect to")
+
     def matches(self, **match_options):
         target_host = match_options.get('host')
         target_port = match_options.get('port')
-        return target_host == self.host and target_port == self.port
+        if target_host != self.host or target_port != self.port or \
+                match_options.get('tunnel') != self.tunnel:
+            return False
+        # a connection is only reused with the ssl settings it was opened
+        # with.
+        ssl_args = dict([(k, v) for k, v in match_options.items() \
+                if k not in CONNECTION_ARGS])
+        return self.ssl_identity == ssl_identity(
+                match_options.get('is_ssl', False),
+                match_options.get('ssl_context'), ssl_args)
 
     def is_connected(self):
-        if self._connected:
+        """ return False if the connection can't be reused. The socket is
+        only checked when the connection has been idle for more than
+        `stale_check_after` seconds, None never checks it. """
+        if not self._connected:
+            return False
+        if self.stale_check_after is None or \
+                time.time() - self.last_used < self.stale_check_after:
+            return True
+        return self._check_socket()
+
+    def _check_socket(self):
+        if self.is_ssl or MSG_DONTWAIT is None:
+            # recv flags aren't supported on ssl sockets
             return is_connected(self._s)
+
+        # peek on the underlying socket so green sockets don't wait for
+        # data. A socket with a timeout waits for data before reading
+        # even with MSG_DONTWAIT, it's made non-blocking during the peek.
+        sock = getattr(self._s, '_sock', None) or getattr(self._s, 'fd',
+                self._s)
+        timeout = sock.gettimeout()
+        try:
+            sock.settimeout(0)
+            data = sock.recv(1, socket.MSG_PEEK | MSG_DONTWAIT)
+        except socket.timeout:
+            return True
+        except socket.error, e:
+            return e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK)
+        finally:
+            sock.settimeout(timeout)
+        # the server closed the connection or sent data we didn't ask
+        # for, like a 408 response.
         return False
 
     def handle_exception(self, exception):
@@ -63,8 +213,12 @@ class Connection(Connector):
         self._life = -1
 
     def release(self, should_close=False):
+        if self.hooks:
+            emit(self.hooks, 'pool_checkin', self)
+
         if self._pool is not None:
             if self._connected:
+                self.last_used = time.time()
                 if should_close:
                     self.invalidate()
                 self._pool.release_connection(self)
@@ -85,13 +239,39 @@ class Connection(Connector):
         return self._s
 
     def send_chunk(self, data):
-        chunk = "".join(("%X\r\n" % len(data), data, "\r\n"))
-        self._s.sendall(chunk)
+        self.sendv(chunk_buffers(data))
+
+    def sendv(self, buffers):
+        """ send a list of buffers. Consecutive buffers are joined up to
+        MAX_COALESCE bytes and sent with one call, larger buffers are sent
+        on their own so they are not copied. """
+        group = []
+        size = 0
+        for b in buffers:
+            if not b:
+                continue
+            self.bytes_sent += len(b)
+            if size + len(b) <= MAX_COALESCE:
+                group.append(b)
+                size += len(b)
+                continue
+
+            if group:
+                self._s.sendall("".join(group))
+            if len(b) > MAX_COALESCE:
+                self._s.sendall(b)
+                group, size = [], 0
+            else:
+                group, size = [b], len(b)
+
+        if group:
+            self._s.sendall("".join(group))
 
     def send(self, data, chunked=False):
         if chunked:
             return self.send_chunk(data)
 
+        self.bytes_sent += len(data)
         return self._s.sendall(data)
 
     def sendlines(self, lines, chunked=False):
@@ -99,19 +279,87 @@ class Connection(Connector):
             self.send(line, chunked=chunked)
 
 
-    # TODO: add support for sendfile api
     def sendfile(self, data, chunked=False):
-        """ send a data from a FileObject """
+        """ send a data from a FileObject. Regular files are sent with
+        the sendfile system call when the connection isn't encrypted and
+        the body isn't chunked. """
 
         if hasattr(data, 'seek'):
             data.seek(0)
 
+        if sendfile is not None and not chunked and not self.is_ssl:
+            if self._sendfile(data):
+                return
+
         while True:
             binarydata = data.read(CHUNK_SIZE)
             if binarydata == '':
                 break
             self.send(binarydata, chunked=chunked)
 
+    def _sendfile(self, data):
+        """ send a regular file with sendfile, return False if the file
+        can't be sent that way. """
+        try:
+            fileno = data.fileno()
+            st = os.fstat(fileno)
+            offset = data.tell()
+        except (AttributeError, IOError, OSError, ValueError):
+            return False
+
+        if not stat.S_ISREG(st.st_mode):
+            return False
+
+        sockno = self._s.fileno()
+        timeout = self._s.gettimeout()
+        while offset < st.st_size:
+            try:
+                sent = sendfile(sockno, fileno, offset, st.st_size - offset)
+            except (IOError, OSError), e:
+                if e.errno == errno.EINTR:
+                    continue
+                elif e.errno == errno.EAGAIN:
+                    # socket with a timeout, wait until it's writable
+                    _, w, _ = self.backend_mod.Select([], [self._s], [],
+                            timeout)
+                    if not w:
+                        raise socket.timeout("timed out")
+                    continue
+                raise socket.error(e.errno, e.strerror)
+
+            if not sent:
+                # the file has been truncated
+                break
+            offset += sent
+            self.bytes_sent += sent
+
+        data.seek(offset)
+        return True
 
     def recv(self, size=1024):
-        return self._s.recv(size)
+        data = self._s.recv(size)
+        self.bytes_received += len(data)
+        return data
+
+    def reader(self):
+        """ return a raw reader of the socket counting the bytes
+        received """
+        return ConnectionReader(self)
+
+
+class ConnectionReader(SocketReader):
+
+    def __init__(self, conn):
+        SocketReader.__init__(self, conn.socket())
+        self.conn = conn
+        self.first_byte = None
+
+    def readinto(self, b):
+        n = SocketReader.readinto(self, b)
+        if n:
+            if self.first_byte is None:
+                self.first_byte = time.time()
+                if self.conn.hooks:
+                    emit(self.conn.hooks, 'first_byte', self.conn)
+            self.conn.bytes_received += n
+        return n
@@ -239,3 +239,200 @@ class MultiDict(DictMixin):
             yield v
 
 
+
+class Headers(MultiDict):
+
+    """
+        MultiDict of http headers keeping an index of the items by
+        lowercase name, so case insensitive lookups don't scan all the
+        headers. The index is built on the first lookup, it maps a name
+        to its first item, the items of names set more than once are
+        also kept in a list. Items keep their order and a name can have
+        multiple values.
+    """
+
+    def __init__(self, *args, **kw):
+        if len(args) > 1:
+            raise TypeError("Headers can only be called with one positional argument")
+        self._items = []
+        self._first = None
+        self._multi = None
+        if args:
+            self.extend(args[0])
+        if kw:
+            self.extend(kw)
+
+    def _index__get(self):
+        if self._first is None:
+            items = self._items
+            lkeys = [k.lower() for k, v in items]
+            self._first = dict(zip(lkeys[::-1], items[::-1]))
+            self._multi = {}
+            if len(self._first) < len(items):
+                multi = {}
+                for lkey, item in zip(lkeys, items):
+                    multi.setdefault(lkey, []).append(item)
+                self._multi = dict([(lkey, l) for lkey, l in \
+                        multi.iteritems() if len(l) > 1])
+        return self._first
+    _index = property(_index__get)
+
+    def _lookup(self, lkey):
+        """ return the items indexed under lkey """
+        item = self._index.get(lkey)
+        if item is None:
+            return ()
+        return self._multi.get(lkey) or (item,)
+
+    def _append(self, item):
+        self._items.append(item)
+        if self._first is not None:
+            lkey = item[0].lower()
+            if lkey in self._multi:
+                self._multi[lkey].append(item)
+            elif lkey in self._first:
+                self._multi[lkey] = [self._first[lkey], item]
+            else:
+                self._first[lkey] = item
+
+    def _remove(self, lkey, items):
+        """ remove items, all indexed under lkey """
+        ids = set([id(item) for item in items])
+        self._items = [i for i in self._items if id(i) not in ids]
+        indexed = [i for i in self._lookup(lkey) if id(i) not in ids]
+        self._multi.pop(lkey, None)
+        if not indexed:
+            del self._first[lkey]
+        else:
+            self._first[lkey] = indexed[0]
+            if len(indexed) > 1:
+                self._multi[lkey] = indexed
+
+    def __getitem__(self, key):
+        for k, v in reversed(self._lookup(key.lower())):
+            if k == key:
+                return v
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        try:
+            del self[key]
+        except KeyError:
+            pass
+        self._append((key, value))
+
+    def add(self, key, value):
+        """
+        Add the key and value, not overwriting any previous value.
+        """
+        self._append((key, value))
+
+    def getall(self, key):
+        return [v for k, v in self._lookup(key.lower()) if k == key]
+
+    def iget(self, key):
+        """like get but case insensitive """
+        item = self._index.get(key.lower())
+        if item is not None:
+            return item[1]
+        return None
+
+    def igetall(self, key):
+        """ return all the values of a header, case insensitive """
+        return [v for k, v in self._lookup(key.lower())]
+
+    def __delitem__(self, key):
+        lkey = key.lower()
+        items = [item for item in self._lookup(lkey) if item[0] == key]
+        if not items:
+            raise KeyError(key)
+        self._remove(lkey, items)
+
+    def __contains__(self, key):
+        for k, v in self._lookup(key.lower()):
+            if k == key:
+                return True
+        return False
+
+    has_key = __contains__
+
+    def icontains(self, key):
+        """ like `in` but case insensitive """
+        return key.lower() in self._index
+
+    def clear(self):
+        self._items = []
+        self._first = None
+        self._multi = None
+
+    def setdefault(self, key, default=None):
+        for k, v in self._lookup(key.lower()):
+            if k == key:
+                return v
+        self._append((key, default))
+        return default
+
+    def pop(self, key, *args):
+        if len(args) > 1:
+            raise TypeError, "pop expected at most 2 arguments, got "\
+                              + repr(1 + len(args))
+        lkey = key.lower()
+        for item in self._lookup(lkey):
+            if item[0] == key:
+                self._remove(lkey, [item])
+                return item[1]
+        if args:
+            return args[0]
+        raise KeyError(key)
+
+    def ipop(self, key, *args):
+        """ like pop but case insensitive """
+        if len(args) > 1:
+            raise TypeError, "pop expected at most 2 arguments, got "\
+                              + repr(1 + len(args))
+        lkey = key.lower()
+        item = self._index.get(lkey)
+        if item is not None:
+            self._remove(lkey, [item])
+            return item[1]
+        if args:
+            return args[0]
+        raise KeyError(key)
+
+    def popitem(self):
+        item = self._items[-1]
+        self._remove(item[0].lower(), [item])
+        return item
+
+    def extend(self, other=None, **kwargs):
+        if other is None:
+            items = []
+        elif isinstance(other, MultiDict):
+            items = list(other.iteritems())
+        elif hasattr(other, 'items'):
+            items = list(other.items())
+        elif hasattr(other, 'keys'):
+            items = [(k, other[k]) for k in other.keys()]
+        else:
+            items = list(other)
+
+        if self._first is None:
+            self._items.extend(items)
+        else:
+            for item in items:
+                self._append(item)
+        if kwargs:
+            self.update(kwargs)
+
+    def serialize(self, exclude=()):
+        """ return the headers as "Name: value\\r\\n" lines. Headers
+        whose lowercase name is in exclude are skipped. """
+        items = self._items
+        if exclude and (self._first is None or \
+                self._first.viewkeys() & exclude):
+            items = [(k, v) for k, v in items if k.lower() not in exclude]
+        lines = "".join(["%s: %s\r\n" % (k, v) for k, v in items])
+        if isinstance(lines, unicode):
+            # unicode values are converted with str as before
+            lines = "".join(["%s: %s\r\n" % (k, str(v)) for k, v in items])
+        return lines
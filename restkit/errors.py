@@ -71,8 +71,15 @@ class RedirectLimit(Exception):
 class RequestError(Exception):
     """Exception raised when a request is malformed"""
 
+class CircuitBreakerOpen(RequestError):
+    """ Exception raised when the circuit breaker of the host is open """
+
 class RequestTimeout(Exception):
     """ Exception raised on socket timeout """
+
+class PoolTimeout(RequestTimeout):
+    """ Exception raised when no connection to the host was available
+    before the pool timeout """
     
 class InvalidUrl(Exception):
     """
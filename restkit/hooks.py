@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+"""
+restkit.hooks
+~~~~~~~~~~~~~
+
+Events of the request lifecycle that can be traced with hooks registered
+on the client. Hooks are only looked up when at least one is registered.
+
+Events and arguments passed to the hooks:
+
+- pool_checkout(request, conn): a connection was taken from the pool
+- pool_checkin(conn): a connection was released
+- connect_start(host, port): a new connection is opened
+- connect_end(conn): the new connection is connected
+- tls_done(conn): the TLS handshake of the new connection is done
+- headers_sent(request, conn): the request line and headers were sent
+- body_sent(request, conn): the request body was sent
+- first_byte(conn): the first byte of the response was received
+- response_headers(request, status, headers): the response headers
+  were parsed
+- body_complete(response): the response body was read
+- retry(request, tries, delay): the request will be tried again after
+  delay seconds
+- redirect(request, location): the request is redirected
+"""
+
+import logging
+
+EVENTS = ('pool_checkout', 'pool_checkin', 'connect_start', 'connect_end',
+        'tls_done', 'headers_sent', 'body_sent', 'first_byte',
+        'response_headers', 'body_complete', 'retry', 'redirect',)
+
+log = logging.getLogger(__name__)
+
+
+def make_hooks(hooks=None):
+    """ return a registry from a dict of events to a function or a list
+    of functions """
+    registry = {}
+    for event, fns in (hooks or {}).items():
+        if callable(fns):
+            fns = [fns]
+        for fn in fns:
+            add_hook(registry, event, fn)
+    return registry
+
+def add_hook(registry, event, fn):
+    if event not in EVENTS:
+        raise ValueError("unknown event: %s" % event)
+    registry.setdefault(event, []).append(fn)
+
+def remove_hook(registry, event, fn):
+    fns = registry.get(event, [])
+    if fn in fns:
+        fns.remove(fn)
+    if not fns:
+        # an empty registry is false, so no event is emitted
+        registry.pop(event, None)
+
+def emit(registry, event, *args):
+    """ call the hooks registered for event. Errors raised by a hook are
+    logged and don't stop the request. """
+    for fn in registry.get(event, ()):
+        try:
+            fn(*args)
+        except Exception:
+            log.exception("error in %s hook" % event)
@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+"""
+restkit.jsonstream
+~~~~~~~~~~~~~~~~~~
+
+Incremental parsing of JSON documents, so the elements of a large array
+can be used while the response is still read.
+"""
+
+import re
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+CHUNK_SIZE = 64 * 1024
+
+TOKEN_RE = re.compile(r'[ \t\n\r]*(?:([\[\]{},:])|'
+        r'("[^"\\]*(?:\\.[^"\\]*)*")|([^ \t\n\r\[\]{},:"]+))', re.S)
+
+SCALAR_RE = re.compile(r'(-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?|'
+        r'true|false|null)$')
+
+STRING = 's'
+SCALAR = 'v'
+
+# states of the parser: what the next token can be
+OPEN = 'open' # first value or key of a container, or its end
+VALUE = 'value'
+KEY = 'key'
+COLON = 'colon'
+NEXT = 'next' # a comma or the end of the container
+
+CLOSE = {'[': ']', '{': '}'}
+
+_decoder = json.JSONDecoder()
+
+
+class JSONLexer(object):
+    """ split a JSON document read from a file object into tokens. Only
+    the unread part of the document is kept in memory, from `mark` if it
+    is set. """
+
+    def __init__(self, stream, chunk_size=CHUNK_SIZE):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.mark = None
+        self.eof = False
+
+    def _fill(self):
+        keep = self.pos
+        if self.mark is not None:
+            keep = self.mark
+            self.mark = 0
+        if keep:
+            self.buf = self.buf[keep:]
+            self.pos -= keep
+
+        data = self.stream.read(self.chunk_size)
+        if data:
+            self.buf += data
+        else:
+            self.eof = True
+
+    def next(self):
+        """ return (kind, start, end) of the next token or None at the
+        end of the document. kind is the punctuation character, `STRING`
+        or `SCALAR`. """
+        while True:
+            m = TOKEN_RE.match(self.buf, self.pos)
+            # a token ending with the buffer may continue in the next
+            # chunk
+            if m is not None and (m.end() < len(self.buf) or self.eof):
+                break
+
+            if self.eof:
+                if self.buf[self.pos:].strip():
+                    raise ValueError("invalid JSON: %r" %
+                            self.buf[self.pos:self.pos + 20])
+                return None
+            self._fill()
+
+        end = self.pos = m.end()
+        group = m.lastindex
+        if group == 1:
+            return m.group(1), end - 1, end
+        elif group == 2:
+            return STRING, m.start(2), end
+
+        if SCALAR_RE.match(m.group(3)) is None:
+            raise ValueError("invalid JSON value: %r" % m.group(3))
+        return SCALAR, m.start(3), end
+
+    def text(self, start, end):
+        return self.buf[start:end]
+
+
+def _advance(state, container, kind):
+    """ return the state following a token of kind read in container,
+    "[", "{" or None at the top level. ValueError is raised if the token
+    isn't expected there. """
+    if kind in ']}':
+        if container is None or CLOSE[container] != kind or \
+                state not in (OPEN, NEXT):
+            raise ValueError("invalid JSON: unexpected %s" % kind)
+        return NEXT
+    elif kind == ',':
+        if container is None or state != NEXT:
+            raise ValueError("invalid JSON: unexpected ,")
+        return container == '{' and KEY or VALUE
+    elif kind == ':':
+        if state != COLON:
+            raise ValueError("invalid JSON: unexpected :")
+        return VALUE
+    elif container == '{' and state in (OPEN, KEY):
+        if kind != STRING:
+            raise ValueError("invalid JSON: key expected")
+        return COLON
+    elif state not in (OPEN, VALUE):
+        raise ValueError("invalid JSON: %s expected" % (state == COLON
+            and ":" or "separator"))
+    return kind in '[{' and OPEN or NEXT
+
+
+def _skip(lexer, kind):
+    """ read tokens until the container of kind just opened is closed """
+    stack = [kind]
+    state = OPEN
+    while stack:
+        token = lexer.next()
+        if token is None:
+            raise ValueError("unexpected end of JSON document")
+        kind = token[0]
+        state = _advance(state, stack[-1], kind)
+        if kind in '[{':
+            stack.append(kind)
+        elif kind in ']}':
+            stack.pop()
+    return lexer.pos
+
+
+def _read_container(lexer, start, keep=True):
+    """ read the array or object opened at start and return its value if
+    keep is true. Most values are decoded at once from the buffer, values
+    continuing in the next chunks are read token by token. """
+    try:
+        value, end = _decoder.raw_decode(lexer.buf, start)
+    except ValueError:
+        pass
+    else:
+        lexer.pos = end
+        return value
+
+    kind = lexer.buf[start]
+    if not keep:
+        _skip(lexer, kind)
+        return None
+
+    lexer.mark = start
+    end = _skip(lexer, kind)
+    start, lexer.mark = lexer.mark, None
+    return _decoder.decode(lexer.text(start, end))
+
+
+def iter_json(stream, prefix="item", chunk_size=CHUNK_SIZE):
+    """ iterate over the values found at prefix in the JSON document read
+    from stream.
+
+    :param stream: file object with a read method
+    :param prefix: path of the values, the keys of the objects and
+    "item" for the elements of an array joined with dots. "item" yields
+    the elements of a top level array, "rows.item" the rows of a CouchDB
+    view and "" the whole document.
+    :param chunk_size: int, size of the reads
+
+    Only the value being decoded is kept in memory, the rest of the
+    document is skipped. ValueError is raised if the document is invalid,
+    the strings that are skipped are not decoded though, invalid escapes
+    in them aren't detected.
+    """
+    if isinstance(prefix, str):
+        prefix = prefix.decode('utf-8')
+    target = prefix and prefix.split(".") or []
+
+    lexer = JSONLexer(stream, chunk_size)
+    stack = [] # containers on the path to prefix
+    names = [] # name of the next value of each container
+    state = VALUE
+
+    while True:
+        token = lexer.next()
+        if token is None:
+            if stack or state != NEXT:
+                raise ValueError("unexpected end of JSON document")
+            return
+
+        kind, start, end = token
+        container = stack and stack[-1] or None
+        is_key = container == '{' and state in (OPEN, KEY)
+        state = _advance(state, container, kind)
+        if kind in ']}':
+            stack.pop()
+            names.pop()
+            continue
+        elif kind in ',:':
+            continue
+        elif is_key:
+            names[-1] = _decoder.raw_decode(lexer.buf, start)[0]
+            continue
+
+        if names == target:
+            if kind in '[{':
+                yield _read_container(lexer, start)
+                state = NEXT
+            else:
+                yield _decoder.raw_decode(lexer.buf, start)[0]
+        elif kind in '[{':
+            if names == target[:len(names)]:
+                stack.append(kind)
+                names.append(kind == '[' and u"item" or None)
+            else:
+                _read_container(lexer, start, False)
+                state = NEXT
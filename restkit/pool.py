@@ -0,0 +1,362 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+"""
+restkit.pool
+~~~~~~~~~~~~
+
+Connection pool limiting the number of connections opened to each host
+and keeping statistics about them.
+"""
+
+import bisect
+import collections
+import time
+import weakref
+
+from socketpool import pool
+from socketpool.pool import MaxTriesError
+
+from restkit.backends import load_backend
+from restkit.errors import PoolTimeout, ProxyError
+
+# waiters check the pool at least this often, so a connection garbage
+# collected without being released doesn't leave them waiting.
+WAIT_INTERVAL = 1.0
+
+# upper bounds in seconds of the buckets of the wait time histogram
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+
+
+def _conn_key(conn):
+    return (getattr(conn, 'host', None), getattr(conn, 'port', None),
+            getattr(conn, 'tunnel', None))
+
+def _key_name(key):
+    """ "host:port", or "host:port via proxy:port" for a tunnel """
+    if key[2] is None:
+        return "%s:%s" % key[:2]
+    return "%s:%s via %s:%s" % (key[2] + key[:2])
+
+
+class HostStats(object):
+    """ counters of the connections to a (host, port) """
+
+    COUNTERS = ('created', 'closed', 'reused', 'connect_failures',
+            'bytes_sent', 'bytes_received',)
+
+    def __init__(self):
+        for name in self.COUNTERS:
+            setattr(self, name, 0)
+        self.waits = [0] * (len(WAIT_BUCKETS) + 1)
+
+    def record_wait(self, duration):
+        self.waits[bisect.bisect_left(WAIT_BUCKETS, duration)] += 1
+
+    def add(self, other):
+        for name in self.COUNTERS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.waits = [a + b for a, b in zip(self.waits, other.waits)]
+
+    def as_dict(self):
+        stats = dict([(name, getattr(self, name)) for name in \
+                self.COUNTERS])
+        requests = self.created + self.reused
+        stats['reuse_ratio'] = requests and self.reused / float(requests)
+        bounds = ["<=%s" % b for b in WAIT_BUCKETS] + [">%s" % \
+                WAIT_BUCKETS[-1]]
+        stats['wait_times'] = dict(zip(bounds, self.waits))
+        return stats
+
+
+class ConnectionPool(pool.ConnectionPool):
+    """ socketpool connection pool with per host limits.
+
+    :param max_per_host: int, maximum number of connections, idle or
+    in use, opened to a (host, port). None means no limit.
+    :param max_connecting: int, maximum number of connections being
+    established at the same time to a (host, port). None means no limit.
+    :param pool_timeout: float, time in seconds a caller waits for a
+    connection when a limit is reached before `PoolTimeout` is raised.
+    None means wait forever.
+    :param idle_timeout: float, time in seconds a connection can stay
+    idle in the pool. None means no limit.
+
+    Connections idle for more than `idle_timeout` or opened for more
+    than `max_lifetime` seconds are closed by the reaper every
+    `reap_delay` seconds, and are never returned by `get`.
+
+    Callers over a limit wait in a FIFO queue per host and are woken when
+    a connection to the host is released or closed. `stats` returns the
+    counters of the pool. Tunnels opened through a proxy count for the
+    host they reach, not for the proxy.
+    """
+
+    def __init__(self, factory, max_per_host=None, max_connecting=None,
+            pool_timeout=None, idle_timeout=None, **options):
+        self.max_per_host = max_per_host
+        self.max_connecting = max_connecting
+        self.pool_timeout = pool_timeout
+        self.idle_timeout = idle_timeout
+        self._conns = {}
+        self._connecting = {}
+        self._waiters = {}
+        self._stats = {}
+        super(ConnectionPool, self).__init__(factory, **options)
+        self._backend = load_backend(self.backend_mod)
+        self._lock = self._backend.Lock()
+
+    def too_old(self, conn):
+        now = time.time()
+        if now - conn.get_lifetime() > self.max_lifetime:
+            return True
+        if self.idle_timeout is not None:
+            last_used = getattr(conn, 'last_used', None)
+            if last_used is not None and now - last_used > self.idle_timeout:
+                return True
+        return False
+
+    def _key(self, options):
+        return (options.get('host'), options.get('port'),
+                options.get('tunnel'))
+
+    def _host_conns(self, key):
+        try:
+            return self._conns[key]
+        except KeyError:
+            return self._conns.setdefault(key, weakref.WeakSet())
+
+    def _host_stats(self, key):
+        try:
+            return self._stats[key]
+        except KeyError:
+            return self._stats.setdefault(key, HostStats())
+
+    def _collect(self, conn):
+        """ add the bytes sent and received by conn to the stats """
+        stats = self._host_stats(_conn_key(conn))
+        sent = getattr(conn, 'bytes_sent', 0)
+        received = getattr(conn, 'bytes_received', 0)
+        if sent or received:
+            stats.bytes_sent += sent
+            stats.bytes_received += received
+            conn.bytes_sent = conn.bytes_received = 0
+
+    def _has_capacity(self, key):
+        connecting = self._connecting.get(key, 0)
+        if self.max_connecting is not None and \
+                connecting >= self.max_connecting:
+            return False
+        if self.max_per_host is not None and \
+                len(self._host_conns(key)) + connecting >= self.max_per_host:
+            return False
+        return True
+
+    def _notify(self, key):
+        """ wake up the first caller waiting for a connection to key """
+        waiters = self._waiters.get(key)
+        if waiters:
+            waiters[0].set()
+
+    def _discard(self, conn):
+        key = _conn_key(conn)
+        with self._lock:
+            self._collect(conn)
+            conns = self._conns.get(key)
+            if conns is not None and conn in conns:
+                conns.discard(conn)
+                self._host_stats(key).closed += 1
+            self._notify(key)
+
+    def _reap_connection(self, conn):
+        super(ConnectionPool, self)._reap_connection(conn)
+        self._discard(conn)
+
+    def release_connection(self, conn):
+        super(ConnectionPool, self).release_connection(conn)
+        key = _conn_key(conn)
+        with self._lock:
+            self._collect(conn)
+            self._notify(key)
+
+    def _find_idle(self, options):
+        """ return a connected idle connection matching options or None """
+        found = None
+        unmatched = []
+        i = self.pool.qsize()
+        if i:
+            for priority, candidate in self.pool:
+                i -= 1
+                if self.too_old(candidate):
+                    self._reap_connection(candidate)
+                elif not candidate.matches(**options):
+                    unmatched.append((priority, candidate))
+                elif candidate.is_connected():
+                    found = candidate
+                    break
+                else:
+                    self._reap_connection(candidate)
+
+                if i <= 0:
+                    break
+
+        for candidate in unmatched:
+            self.pool.put(candidate)
+        return found
+
+    def _wait_turn(self, key, options, deadline, reuse=True):
+        """ wait until an idle connection to key is available or a new
+        one can be opened. Return the idle connection or None once the
+        caller is allowed to connect.
+
+        When reuse is false idle connections aren't returned, and False
+        is returned if the host has no room for a new connection while
+        some of its connections are idle: they wouldn't be released. """
+        event = None
+        try:
+            while True:
+                with self._lock:
+                    waiters = self._waiters.get(key)
+                    turn = not waiters or waiters[0] is event
+                if turn and reuse:
+                    conn = self._find_idle(options)
+                    if conn is not None:
+                        return conn
+
+                idle = 0
+                if turn and not reuse:
+                    idle = self._idle_counts().get(key, 0)
+
+                with self._lock:
+                    if turn and self._has_capacity(key):
+                        self._connecting[key] = \
+                                self._connecting.get(key, 0) + 1
+                        return None
+                    elif idle:
+                        return False
+
+                    if event is None:
+                        event = self._backend.Event()
+                        self._waiters.setdefault(key,
+                                collections.deque()).append(event)
+                    else:
+                        event.clear()
+
+                timeout = WAIT_INTERVAL
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise PoolTimeout("no connection available to "
+                                "%s after %ss" % (_key_name(key),
+                                    self.pool_timeout))
+                    timeout = min(timeout, remaining)
+                event.wait(timeout)
+        finally:
+            if event is not None:
+                with self._lock:
+                    waiters = self._waiters[key]
+                    waiters.remove(event)
+                    if not waiters:
+                        del self._waiters[key]
+                    else:
+                        self._notify(key)
+
+    def get(self, **options):
+        return self._get(options)
+
+    def connect(self, **options):
+        """ open a new connection even if idle ones are available. It
+        counts in the limits of its host like the connections returned
+        by `get`. None is returned if the host has no room left for a
+        new connection and some of its connections are idle. """
+        return self._get(options, False)
+
+    def _get(self, options, reuse=True):
+        options.update(self.options)
+        key = self._key(options)
+        started = time.time()
+        deadline = None
+        if self.pool_timeout is not None:
+            deadline = started + self.pool_timeout
+
+        tries = 0
+        last_error = None
+        while tries < self.retry_max:
+            conn = self._wait_turn(key, options, deadline, reuse)
+            if conn is False:
+                return None
+            elif conn is not None:
+                with self._lock:
+                    stats = self._host_stats(key)
+                    stats.reused += 1
+                    stats.record_wait(time.time() - started)
+                return conn
+
+            try:
+                conn = self.factory(**options)
+            except ProxyError:
+                # the proxy refused the tunnel, trying again won't help
+                raise
+            except Exception, e:
+                last_error = e
+                conn = None
+            finally:
+                with self._lock:
+                    self._connecting[key] -= 1
+                    stats = self._host_stats(key)
+                    if conn is not None and conn.is_connected():
+                        self._host_conns(key).add(conn)
+                        stats.created += 1
+                        stats.record_wait(time.time() - started)
+                    else:
+                        stats.connect_failures += 1
+                    self._notify(key)
+
+            if conn is not None and conn.is_connected():
+                return conn
+
+            tries += 1
+            self.backend_mod.sleep(self.retry_delay)
+
+        if last_error is None:
+            raise MaxTriesError()
+        raise last_error
+
+    def _idle_counts(self):
+        idle = {}
+        for priority, conn in list(getattr(self.pool, 'queue', ())):
+            key = _conn_key(conn)
+            idle[key] = idle.get(key, 0) + 1
+        return idle
+
+    def stats(self):
+        """ return the statistics of the pool, by "host:port" in "hosts"
+        ("host:port via proxy:port" for tunnels) and summed in "total". Bytes sent and received are counted when
+        a connection is released. """
+        hosts = {}
+        total = HostStats()
+        totals = dict(idle=0, in_use=0, connecting=0, waiting=0)
+        idle = self._idle_counts()
+        with self._lock:
+            keys = set(self._stats) | set(self._conns) | \
+                    set(self._connecting) | set(self._waiters)
+            for key in keys:
+                host_stats = self._host_stats(key)
+                total.add(host_stats)
+                stats = host_stats.as_dict()
+                nidle = idle.get(key, 0)
+                stats.update({
+                    "idle": nidle,
+                    "in_use": max(0, len(self._conns.get(key, ())) - nidle),
+                    "connecting": self._connecting.get(key, 0),
+                    "waiting": len(self._waiters.get(key, ()))
+                })
+                for name in totals:
+                    totals[name] += stats[name]
+                hosts[_key_name(key)] = stats
+
+        total = total.as_dict()
+        total.update(totals)
+        return {"hosts": hosts, "total": total}
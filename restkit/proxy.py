@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+"""
+restkit.proxy
+~~~~~~~~~~~~~
+
+Proxy configuration of a client, read once from its arguments or the
+environment.
+"""
+
+import base64
+import logging
+import os
+import re
+import socket
+import struct
+import urlparse
+
+from restkit.util import parse_netloc
+
+log = logging.getLogger(__name__)
+
+
+def _env(name):
+    return os.environ.get(name.lower()) or os.environ.get(name.upper())
+
+
+def _parse_ip(host):
+    """ return (family, int) for an ip address, None for a host name """
+    for family in (socket.AF_INET, socket.AF_INET6):
+        try:
+            packed = socket.inet_pton(family, host)
+        except (socket.error, ValueError):
+            continue
+        value = 0
+        for part in struct.unpack("!%dI" % (len(packed) // 4), packed):
+            value = (value << 32) | part
+        return family, value
+    return None
+
+
+class NoProxy(object):
+    """ match hosts against a NO_PROXY list: "*", domain names matching
+    the domain and its subdomains, ip addresses and CIDR networks. An
+    entry can end with a port. Invalid entries are ignored. """
+
+    def __init__(self, entries=None):
+        if isinstance(entries, basestring):
+            entries = entries.split(",")
+
+        self.all = False
+        self.networks = []
+        domains = []
+        for entry in entries or []:
+            entry = entry.strip().lower()
+            if not entry:
+                continue
+            if entry == "*":
+                self.all = True
+                continue
+
+            try:
+                self._add(entry, domains)
+            except ValueError:
+                log.warning("invalid NO_PROXY entry ignored: %r" % entry)
+
+        self.domains = None
+        if domains:
+            self.domains = re.compile(r"(^|\.)(%s)$" % "|".join(domains))
+
+    def _add(self, entry, domains):
+        port = None
+        if entry.count(":") == 1 or "]:" in entry:
+            entry, _, port = entry.rpartition(":")
+            port = int(port)
+        entry = entry.strip("[]")
+
+        address, _, bits = entry.partition("/")
+        ip = _parse_ip(address)
+        if ip is not None:
+            family, value = ip
+            size = family == socket.AF_INET and 32 or 128
+            prefix = int(bits or size)
+            if not 0 <= prefix <= size:
+                raise ValueError("invalid prefix length: %s" % bits)
+            mask = ((1 << prefix) - 1) << (size - prefix)
+            self.networks.append((family, value & mask, mask, port))
+        elif bits or not entry:
+            raise ValueError("invalid entry")
+        else:
+            domain = re.escape(entry.lstrip("*").lstrip("."))
+            if port is not None:
+                domain = "%s:%s" % (domain, port)
+            domains.append(domain)
+
+    def match(self, host, port=None):
+        """ return True if requests to host shouldn't use the proxy """
+        if self.all:
+            return True
+
+        host = host.lower().strip("[]")
+        if self.domains is not None:
+            if self.domains.search(host) or (port is not None and \
+                    self.domains.search("%s:%s" % (host, port))):
+                return True
+
+        if self.networks:
+            ip = _parse_ip(host)
+            if ip is not None:
+                family, value = ip
+                for net_family, network, mask, net_port in self.networks:
+                    if net_family == family and value & mask == network \
+                            and net_port in (None, port):
+                        return True
+        return False
+
+
+class Proxy(object):
+    """ a proxy with its address and the value of the
+    Proxy-Authorization header if it needs credentials """
+
+    def __init__(self, url, username=None, password=None):
+        u = urlparse.urlparse(url)
+        if not u.scheme:
+            u = urlparse.urlparse("http://%s" % url)
+        if not username:
+            username, password = u.username, u.password
+        password = password or ""
+
+        self.url = urlparse.urlunparse((u.scheme, u.netloc.split("@")[-1],
+            u.path, u.params, u.query, u.fragment))
+        self.addr = parse_netloc(urlparse.urlparse(self.url))
+        self.authorization = None
+        if username:
+            self.authorization = "Basic %s" % base64.b64encode("%s:%s" %
+                    (urlparse.unquote(username), urlparse.unquote(password)))
+
+    def __repr__(self):
+        return "<%s %s>" % (self.__class__.__name__, self.url)
+
+
+class ProxyConfig(object):
+    """ proxies used by a client.
+
+    :param proxies: dict of url scheme to proxy url, for example
+    {"http": "http://proxy:3128", "https": "http://proxy:3128"}. By
+    default the http_proxy and https_proxy environment variables are used.
+    :param no_proxy: list or comma separated string of hosts reached
+    without proxy. By default the NO_PROXY environment variable.
+
+    Credentials are taken from the proxy url or the proxy_username and
+    proxy_password environment variables.
+    """
+
+    def __init__(self, proxies=None, no_proxy=None):
+        if proxies is None:
+            proxies = {}
+            for scheme in ("http", "https"):
+                url = _env("%s_proxy" % scheme)
+                if url:
+                    proxies[scheme] = url
+
+        if no_proxy is None:
+            no_proxy = _env("no_proxy")
+
+        username = os.environ.get('proxy-username') or \
+                os.environ.get('proxy_username')
+        password = os.environ.get('proxy-password') or \
+                os.environ.get('proxy_password')
+
+        self.proxies = dict([(scheme, Proxy(url, username, password)) \
+                for scheme, url in proxies.items() if url])
+        self.no_proxy = NoProxy(no_proxy)
+
+    def get(self, scheme, host, port=None):
+        """ return the `Proxy` to use for a request or None """
+        proxy = self.proxies.get(scheme)
+        if proxy is None or self.no_proxy.match(host, port):
+            return None
+        return proxy
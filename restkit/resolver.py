@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+"""
+restkit.resolver
+~~~~~~~~~~~~~~~~
+
+DNS cache used by connections so a new connection doesn't always wait
+for getaddrinfo.
+"""
+
+import logging
+import socket
+import time
+
+from restkit.backends import backend_name, load_backend
+
+DNS_TIMEOUT = 60
+DNS_NEGATIVE_TIMEOUT = 5
+
+log = logging.getLogger(__name__)
+
+
+class Resolver(object):
+    """ cache the results of getaddrinfo.
+
+    :param ttl: int, time in seconds a resolved address is kept.
+    :param negative_ttl: int, time in seconds a failed resolution is
+    kept. During this time the error is raised again without asking the
+    resolver.
+    :param refresh_ahead: float, part of the ttl after which an entry is
+    refreshed in the background. The cached address is still used until
+    the new one is resolved. None disables refresh.
+    :param resolver: function with the getaddrinfo signature used to
+    resolve host names. By default the getaddrinfo of the backend.
+    :param backend: backend used to run background refreshes.
+
+    Connections invalidate the entry of a host when none of its addresses
+    accepts the connection, so a host moved to new addresses is resolved
+    again.
+    """
+
+    def __init__(self, ttl=DNS_TIMEOUT, negative_ttl=DNS_NEGATIVE_TIMEOUT,
+            refresh_ahead=0.8, resolver=None, backend="thread"):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.refresh_ahead = refresh_ahead
+        self.resolver = resolver or socket.getaddrinfo
+        self.backend = load_backend(backend)
+        self._cache = {}
+        self._refreshing = set()
+
+    def _lookup(self, host, port):
+        try:
+            addrs = self.resolver(host, port, 0, socket.SOCK_STREAM)
+        except socket.gaierror, e:
+            self._cache[(host, port)] = (time.time() + self.negative_ttl,
+                    None, e)
+            raise
+
+        now = time.time()
+        refresh_at = None
+        if self.refresh_ahead is not None:
+            refresh_at = now + self.ttl * self.refresh_ahead
+        self._cache[(host, port)] = (now + self.ttl, refresh_at, addrs)
+        return addrs
+
+    def _refresh(self, host, port):
+        key = (host, port)
+        entry = self._cache.get(key)
+        try:
+            self._lookup(host, port)
+        except socket.gaierror, e:
+            log.info("DNS refresh of %s failed: %s" % (host, str(e)))
+            # keep the current address until it expires and try again
+            # later.
+            if entry is not None:
+                expires, _, value = entry
+                self._cache[key] = (expires,
+                        time.time() + self.negative_ttl, value)
+        except Exception:
+            log.exception("DNS refresh of %s failed" % host)
+        finally:
+            self._refreshing.discard((host, port))
+
+    def resolve(self, host, port):
+        """ return the list of addrinfo tuples for host and port """
+        key = (host, port)
+        try:
+            expires, refresh_at, value = self._cache[key]
+        except KeyError:
+            return self._lookup(host, port)
+
+        now = time.time()
+        if now >= expires:
+            return self._lookup(host, port)
+
+        if isinstance(value, socket.gaierror):
+            raise value
+
+        if refresh_at is not None and now >= refresh_at and \
+                key not in self._refreshing:
+            self._refreshing.add(key)
+            self.backend.spawn(self._refresh, host, port)
+        return value
+
+    def invalidate(self, host=None, port=None):
+        """ remove an entry from the cache, or all of them """
+        if host is None:
+            self._cache.clear()
+        else:
+            self._cache.pop((host, port), None)
+
+
+_resolvers = {}
+
+def get_resolver(backend_mod):
+    """ return the default resolver of a socketpool backend. It uses the
+    getaddrinfo function of the backend. """
+    name = backend_name(backend_mod)
+    if name not in _resolvers:
+        sock_mod = getattr(backend_mod, 'socket', socket)
+        _resolvers[name] = Resolver(resolver=sock_mod.getaddrinfo,
+                backend=name)
+    return _resolvers[name]
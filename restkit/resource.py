@@ -213,6 +213,13 @@ class Resource(object):
 
         return resp
 
+    def warmup(self, per_host=1, concurrency=None):
+        """ open `per_host` connections to the host of the resource and
+        keep them in the pool. Return the list of (url, exception) for
+        connections that couldn't be opened. See `Client.warmup`. """
+        return self.client.warmup([self.uri], per_host=per_host,
+                concurrency=concurrency)
+
     def update_uri(self, path):
         """
         to set a new uri absolute path
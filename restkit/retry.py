@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+"""
+restkit.retry
+~~~~~~~~~~~~~
+
+Retry policies used by the client to decide if and when a failed request
+is tried again.
+"""
+
+import email.utils
+import errno
+import random
+import socket
+import threading
+import time
+
+from http_parser.http import BadStatusLine, NoMoreData
+
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS', 'TRACE',)
+RETRY_ERRNOS = (errno.EAGAIN, errno.EPIPE, errno.EBADF, errno.ECONNRESET,)
+RETRY_STATUSES = (502, 503, 504,)
+
+
+def parse_retry_after(value):
+    """ return the delay in seconds given by a Retry-After header, or
+    None if it can't be parsed. """
+    if not value:
+        return None
+
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+
+    date = email.utils.parsedate_tz(value)
+    if date is None:
+        return None
+    return max(0, email.utils.mktime_tz(date) - time.time())
+
+
+class RetryBudget(object):
+    """ limit the number of retries to a ratio of the requests done in
+    the last `ttl` seconds, so retries can't multiply the load on a
+    degraded backend.
+
+    :param ratio: float, retries allowed per request.
+    :param min_retries_per_sec: int, retries always allowed each second,
+    so clients doing few requests can still retry.
+    :param ttl: int, size of the window in seconds.
+    """
+
+    def __init__(self, ratio=0.2, min_retries_per_sec=10, ttl=10):
+        self.ratio = ratio
+        self.min_retries_per_sec = min_retries_per_sec
+        self.ttl = max(1, int(ttl))
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self):
+        now = int(time.time())
+        for second in self._buckets.keys():
+            if second <= now - self.ttl:
+                del self._buckets[second]
+        return self._buckets.setdefault(now, [0, 0])
+
+    def deposit(self):
+        """ record a request """
+        with self._lock:
+            self._bucket()[0] += 1
+
+    def withdraw(self):
+        """ record a retry, return False if the budget is exhausted """
+        with self._lock:
+            bucket = self._bucket()
+            requests = sum([b[0] for b in self._buckets.values()])
+            retries = sum([b[1] for b in self._buckets.values()])
+            allowed = self.min_retries_per_sec * self.ttl + \
+                    self.ratio * requests
+            if retries >= allowed:
+                return False
+            bucket[1] += 1
+            return True
+
+
+class RetryPolicy(object):
+    """ decide if a request should be retried and how long to wait.
+
+    The default policy retries connection errors on any method, waiting
+    a constant delay between tries, and never retries on a status code.
+
+    :param max_tries: int, number of retries after the first try.
+    :param backoff: float, delay in seconds before the first retry.
+    :param backoff_factor: float, the delay is multiplied by this factor
+    after each retry. 2 gives an exponential backoff.
+    :param max_backoff: float, maximum delay between two tries.
+    :param jitter: if True, wait a random delay between 0 and the
+    computed backoff.
+    :param methods: methods that can be retried after a connection
+    error. None means all methods.
+    :param retry_statuses: status codes on which an idempotent request
+    is retried, for example `RETRY_STATUSES`.
+    :param status_methods: methods retried on `retry_statuses`.
+    :param respect_retry_after: wait the delay given by the Retry-After
+    header of the response if any.
+    :param max_retry_after: maximum delay accepted from Retry-After.
+    :param budget: `RetryBudget` instance shared by the requests.
+    :param retry_errnos: socket errors on which a request is retried.
+    """
+
+    def __init__(self, max_tries=3, backoff=0.3, backoff_factor=1,
+            max_backoff=30, jitter=False, methods=None, retry_statuses=(),
+            status_methods=IDEMPOTENT_METHODS, respect_retry_after=True,
+            max_retry_after=120, budget=None, retry_errnos=RETRY_ERRNOS):
+        self.max_tries = max_tries
+        self.backoff = backoff
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.methods = methods
+        self.retry_statuses = retry_statuses
+        self.status_methods = status_methods
+        self.respect_retry_after = respect_retry_after
+        self.max_retry_after = max_retry_after
+        self.budget = budget
+        self.retry_errnos = retry_errnos
+
+    def on_request(self, request):
+        """ called once each time a request is performed """
+        if self.budget is not None:
+            self.budget.deposit()
+
+    def can_retry(self, request, tries):
+        if tries >= self.max_tries:
+            return False
+        if self.budget is not None:
+            return self.budget.withdraw()
+        return True
+
+    def should_retry_error(self, request, error, tries):
+        """ return True if the request should be retried after error """
+        if isinstance(error, socket.error):
+            if error.args and error.args[0] not in self.retry_errnos:
+                return False
+        elif not isinstance(error, (NoMoreData, BadStatusLine)):
+            return False
+
+        if self.methods is not None and request.method not in self.methods:
+            return False
+        return self.can_retry(request, tries)
+
+    def should_retry_response(self, request, response, tries):
+        """ return True if the request should be retried because of the
+        response status """
+        if response.status_int not in self.retry_statuses:
+            return False
+        if request.method not in self.status_methods:
+            return False
+        return self.can_retry(request, tries)
+
+    def get_backoff(self, tries, response=None):
+        """ return the delay to wait before the next try """
+        if response is not None and self.respect_retry_after:
+            delay = parse_retry_after(response.headers.get('retry-after'))
+            if delay is not None:
+                return min(delay, self.max_retry_after)
+
+        delay = min(self.max_backoff,
+                self.backoff * (self.backoff_factor ** tries))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
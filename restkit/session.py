@@ -3,8 +3,8 @@
 # This file is part of restkit released under the MIT license.
 # See the NOTICE for more information.
 
-from socketpool import ConnectionPool
 from restkit.conn import Connection
+from restkit.pool import ConnectionPool
 
 
 _default_session = {}
@@ -41,3 +41,10 @@ def set_session(backend_name, **options):
                 backend=backend_name, **options)
         _default_session[backend_name] = pool
     return pool
+
+def stats(backend_name="thread"):
+    """ return the statistics of the default session of a backend """
+    pool = _default_session.get(backend_name)
+    if pool is None or not hasattr(pool, 'stats'):
+        return None
+    return pool.stats()
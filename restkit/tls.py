@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+"""
+restkit.tls
+~~~~~~~~~~~
+
+SSL contexts shared by HTTPS connections.
+"""
+
+import ssl
+import threading
+
+HAS_SSL_CONTEXT = hasattr(ssl, 'SSLContext')
+HAS_SNI = getattr(ssl, 'HAS_SNI', False)
+
+
+def ssl_args_key(ssl_args):
+    """ return a hashable key for a dict of ssl arguments """
+    return tuple(sorted(ssl_args.items()))
+
+
+def make_ssl_context(ssl_args):
+    """ create an SSLContext from the arguments of ssl.wrap_socket, with
+    the same defaults: certificates aren't verified unless cert_reqs is
+    set. """
+    protocol = ssl_args.get('ssl_version',
+            getattr(ssl, 'PROTOCOL_TLS', ssl.PROTOCOL_SSLv23))
+    ctx = ssl.SSLContext(protocol)
+    if hasattr(ctx, 'check_hostname'):
+        ctx.check_hostname = False
+    ctx.verify_mode = ssl_args.get('cert_reqs', ssl.CERT_NONE)
+    if ssl_args.get('ca_certs'):
+        ctx.load_verify_locations(ssl_args['ca_certs'])
+    if ssl_args.get('certfile'):
+        ctx.load_cert_chain(ssl_args['certfile'], ssl_args.get('keyfile'))
+    if ssl_args.get('ciphers'):
+        ctx.set_ciphers(ssl_args['ciphers'])
+    return ctx
+
+
+_contexts = {}
+_contexts_lock = threading.Lock()
+
+def get_ssl_context(ssl_args):
+    """ return the SSLContext shared by the connections using ssl_args """
+    key = ssl_args_key(ssl_args)
+    try:
+        return _contexts[key]
+    except KeyError:
+        with _contexts_lock:
+            if key not in _contexts:
+                _contexts[key] = make_ssl_context(ssl_args)
+            return _contexts[key]
+
+
+SOCKET_ARGS = ('server_side', 'do_handshake_on_connect',
+        'suppress_ragged_eofs', 'server_hostname',)
+
+def context_args(ssl_args):
+    """ return the ssl arguments used to build the context """
+    return dict([(k, v) for k, v in ssl_args.items() if k not in \
+            SOCKET_ARGS])
+
+
+def wrap_socket(sock, host, ssl_args, ssl_context=None):
+    """ wrap a connected socket with ssl_context, or the context shared
+    by the connections using the same ssl arguments. The host name is
+    sent with SNI. """
+    if ssl_context is None:
+        if not HAS_SSL_CONTEXT:
+            return ssl.wrap_socket(sock, **ssl_args)
+        ssl_context = get_ssl_context(context_args(ssl_args))
+
+    options = dict(
+            do_handshake_on_connect=ssl_args.get('do_handshake_on_connect',
+                True),
+            suppress_ragged_eofs=ssl_args.get('suppress_ragged_eofs', True))
+    if HAS_SNI:
+        options['server_hostname'] = ssl_args.get('server_hostname', host)
+    return ssl_context.wrap_socket(sock, **options)
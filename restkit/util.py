@@ -83,6 +83,28 @@ def parse_netloc(uri):
         host = host[1:-1]
     return (host, port)
 
+class URL(urlparse.ParseResult):
+    """ result of urlparse with the values used to send a request
+    computed once:
+
+    - addr: (host, port) of the server
+    - is_ssl: True for https urls
+    - host_header: netloc as a bytestring, the default Host header
+    - request_path: path with the query, as sent in the request line
+    - pool_key: key of the connections to the server
+    """
+
+    def __new__(cls, url):
+        self = super(URL, cls).__new__(cls, *urlparse.urlparse(url))
+        self.url = url
+        self.is_ssl = self.scheme == "https"
+        self.addr = parse_netloc(self)
+        self.host_header = to_bytestring(self.netloc)
+        self.request_path = urlparse.urlunparse(('', '', self.path or '/',
+            self.params, self.query, self.fragment))
+        self.pool_key = (self.addr, self.is_ssl)
+        return self
+
 def to_bytestring(s):
     if not isinstance(s, basestring):
         raise TypeError("value should be a str or unicode")
@@ -249,6 +271,22 @@ def parse_cookie(cookie, final_url):
     return cookiedict
     
 
+class cached_property(object):
+    """ a property computed on first access and stored in the instance
+    dict, so the function is only called once """
+
+    def __init__(self, func):
+        self.func = func
+        self.__name__ = func.__name__
+        self.__doc__ = func.__doc__
+
+    def __get__(self, obj, type=None):
+        if obj is None:
+            return self
+        value = obj.__dict__[self.__name__] = self.func(obj)
+        return value
+
+
 class deprecated_property(object):
     """
     Wraps a decorator, with a deprecation warning or error
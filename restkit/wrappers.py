@@ -4,20 +4,21 @@
 # See the NOTICE for more information.
 
 import cgi
-import copy
+from io import BytesIO
 import mimetypes
 import os
-from StringIO import StringIO
+import time
 import types
-import urlparse
 import uuid
 
-from restkit.datastructures import MultiDict
+from restkit.datastructures import Headers
 from restkit.errors import AlreadyRead, RequestError
 from restkit.forms import multipart_form_encode, form_encode
+from restkit.hooks import emit
+from restkit.jsonstream import iter_json
 from restkit.tee import ResponseTeeInput
-from restkit.util import to_bytestring
-from restkit.util import parse_cookie
+from restkit.util import to_bytestring, URL
+from restkit.util import cached_property, parse_cookie
 
 class Request(object):
 
@@ -31,6 +32,9 @@ class Request(object):
         self._body = None
 
         self.is_proxied = False
+        self.timings = None
+        # number of redirections followed
+        self.redirects = 0
 
         # set parsed uri
         self.headers = headers
@@ -38,32 +42,38 @@ class Request(object):
             self.body = body
 
     def _headers__get(self):
-        if not isinstance(self._headers, MultiDict):
-            self._headers = MultiDict(self._headers or [])
+        if not isinstance(self._headers, Headers):
+            self._headers = Headers(self._headers or [])
         return self._headers
     def _headers__set(self, value):
-        self._headers = MultiDict(copy.copy(value))
+        self._headers = Headers(value)
     headers = property(_headers__get, _headers__set, doc=_headers__get.__doc__)
 
-    def _parsed_url(self):
-        if self.url is None:
-            raise ValueError("url isn't set")
-        return urlparse.urlparse(self.url)
-    parsed_url = property(_parsed_url, doc="parsed url")
+    def _url__get(self):
+        return self._url
+    def _url__set(self, url):
+        self._url = url
+        self._parsed_url = None
+    url = property(_url__get, _url__set)
+
+    def _parsed_url__get(self):
+        """ `restkit.util.URL` instance, parsed once each time the url is
+        set """
+        if self._parsed_url is None:
+            if self._url is None:
+                raise ValueError("url isn't set")
+            self._parsed_url = URL(self._url)
+        return self._parsed_url
+    parsed_url = property(_parsed_url__get, doc=_parsed_url__get.__doc__)
 
     def _path__get(self):
-        parsed_url = self.parsed_url
-        path = parsed_url.path or '/'
-
-        return urlparse.urlunparse(('','', path, parsed_url.params,
-            parsed_url.query, parsed_url.fragment))
+        return self.parsed_url.request_path
     path = property(_path__get)
 
     def _host__get(self):
-        h = to_bytestring(self.parsed_url.netloc)
         hdr_host = self.headers.iget("host")
         if not hdr_host:
-            return h
+            return self.parsed_url.host_header
         return hdr_host
     host = property(_host__get)
 
@@ -72,7 +82,7 @@ class Request(object):
         return (te is not None and te.lower() == "chunked")
 
     def is_ssl(self):
-        return self.parsed_url.scheme == "https"
+        return self.parsed_url.is_ssl
 
     def _set_body(self, body):
         ctype = self.headers.ipop('content-type', None)
@@ -137,12 +147,75 @@ class Request(object):
         return self._body
     body = property(_get_body, _set_body, doc="request body")
 
+    def can_rewind(self):
+        return self.body is None or hasattr(self.body, 'seek') or \
+                isinstance(self.body, types.StringTypes)
+
     def maybe_rewind(self, msg=""):
-        if self.body is not None:
-            if not hasattr(self.body, 'seek') and \
-                    not isinstance(self.body, types.StringTypes):
-                raise RequestError("error: '%s', body can't be rewind."
-                        % msg)
+        if not self.can_rewind():
+            raise RequestError("error: '%s', body can't be rewind."
+                    % msg)
+
+
+class Timings(object):
+    """ durations in seconds of the phases of a request:
+
+    - pool: waiting for a connection from the pool
+    - dns, connect, tls: setup of a new connection, None when the
+      connection is reused
+    - send: writing the request
+    - ttfb: from the end of the request to the first byte of the response
+    - headers: parsing the status line and the headers
+    - body: reading the body, None until it's read
+
+    `reused` tells if the connection was reused, `retries` and
+    `redirects` how many tries and redirections happened before.
+    """
+
+    PHASES = ('pool', 'dns', 'connect', 'tls', 'send', 'ttfb', 'headers',
+            'body',)
+
+    def __init__(self, retries=0, redirects=0):
+        for phase in self.PHASES:
+            setattr(self, phase, None)
+        self.reused = True
+        self.retries = retries
+        self.redirects = redirects
+        self._last = time.time()
+
+    def mark(self, phase, now=None):
+        """ set the duration of phase to the time elapsed since the
+        previous phase """
+        now = now or time.time()
+        setattr(self, phase, now - self._last)
+        self._last = now
+
+    def set_connection(self, conn):
+        """ set the pool phase and the setup durations of a new
+        connection, taken only once from the connection """
+        self.mark('pool')
+        setup = getattr(conn, 'setup_timings', None)
+        if setup is not None:
+            conn.setup_timings = None
+            self.reused = False
+            self.dns, self.connect, self.tls = setup
+            self.pool = max(0, self.pool - sum([d for d in setup if d]))
+
+    def set_response(self, first_byte=None):
+        """ set ttfb and headers once the headers are parsed """
+        now = time.time()
+        self.mark('ttfb', first_byte or now)
+        self.mark('headers', now)
+
+    def as_dict(self):
+        timings = dict([(phase, getattr(self, phase)) for phase in \
+                self.PHASES])
+        timings.update(reused=self.reused, retries=self.retries,
+                redirects=self.redirects)
+        return timings
+
+    def __repr__(self):
+        return "<%s %s>" % (self.__class__.__name__, self.as_dict())
 
 
 class BodyWrapper(object):
@@ -168,6 +241,7 @@ class BodyWrapper(object):
         if not self.eof:
             self.body.read()
 
+        self.resp._body_read()
         self.connection.release(self.resp.should_close)
         self._closed = True
 
@@ -189,6 +263,15 @@ class BodyWrapper(object):
             self.close()
         return data
 
+    def readinto(self, b):
+        """ read up to len(b) bytes into the writable buffer b and return
+        the number of bytes read """
+        n = self.body.readinto(b)
+        if not n and len(b):
+            self.eof = True
+            self.close()
+        return n
+
     def readline(self, limit=-1):
         line = self.body.readline(limit)
         if not line:
@@ -212,6 +295,7 @@ class Response(object):
     def __init__(self, connection, request, resp):
         self.request = request
         self.connection = connection
+        self.timings = request.timings
 
         self._resp = resp
 
@@ -220,27 +304,36 @@ class Response(object):
         self.status = resp.status()
         self.status_int = resp.status_code()
         self.version = resp.version()
-        self.headerslist = self.headers.items()
-        self.location = self.headers.get('location')
         self.final_url = request.url
         self.should_close = not resp.should_keep_alive()
 
-        # cookies
-        if 'set-cookie' in self.headers:
-            cookie_header = self.headers.get('set-cookie')
-            self.cookies = parse_cookie(cookie_header, self.final_url)
-
-
         self._closed = False
         self._already_read = False
+        self._stream = None
 
         if request.method == "HEAD":
             """ no body on HEAD, release the connection now """
             self.connection.release(True)
-            self._body = StringIO("")
+            self._body = BytesIO("")
         else:
             self._body = resp.body_file()
 
+    @cached_property
+    def headerslist(self):
+        return self.headers.items()
+
+    @cached_property
+    def location(self):
+        return self.headers.get('location')
+
+    @cached_property
+    def cookies(self):
+        """ cookies set by the response. Like the headers they are only
+        parsed when used. """
+        if 'set-cookie' not in self.headers:
+            raise AttributeError("no cookie set by the response")
+        return parse_cookie(self.headers.get('set-cookie'), self.final_url)
+
     def __getitem__(self, key):
         try:
             return getattr(self, key)
@@ -257,6 +350,14 @@ class Response(object):
     def can_read(self):
         return not self._already_read
 
+    def _body_read(self):
+        if self.timings is not None and self.timings.body is None:
+            self.timings.mark('body')
+
+        hooks = getattr(self.connection, 'hooks', None)
+        if hooks:
+            emit(hooks, 'body_complete', self)
+
     def close(self):
         self.connection.release(True)
 
@@ -265,6 +366,7 @@ class Response(object):
         if not self._already_read:
             self._body.read()
             self._already_read = True
+            self._body_read()
             self.connection.release(self.should_close)
 
     def body_string(self, charset=None, unicode_errors="strict"):
@@ -276,6 +378,7 @@ class Response(object):
 
         body = self._body.read()
         self._already_read = True
+        self._body_read()
 
         self.connection.release(self.should_close)
 
@@ -286,6 +389,15 @@ class Response(object):
                 pass
         return body
 
+    def readinto(self, buffer):
+        """ read up to len(buffer) bytes of the body into a writable
+        buffer like a bytearray or a memoryview and return the number of
+        bytes read. 0 is returned at the end of the body and the
+        connection is released. """
+        if self._stream is None:
+            self._stream = self.body_stream()
+        return self._stream.readinto(buffer)
+
     def body_stream(self):
         """ stream body """
         if not self.can_read():
@@ -295,6 +407,13 @@ class Response(object):
 
         return BodyWrapper(self, self.connection)
 
+    def iter_json(self, prefix="item", **kwargs):
+        """ iterate over the values found at prefix in the JSON body while
+        it is read, for example the rows of a CouchDB view with
+        prefix="rows.item". See `restkit.jsonstream.iter_json` """
+        with self.body_stream() as body:
+            for value in iter_json(body, prefix, **kwargs):
+                yield value
 
     def tee(self):
         """ copy response input to standard output or a file if length >
@@ -17,6 +17,7 @@ import tempfile
 import time
 
 import t
+from restkit.errors import AlreadyRead
 from restkit.filters import BasicAuth
 
 
@@ -268,3 +269,251 @@ def test_024(u, c):
     t.eq(r.status_int, 200)
     
 
+
+@t.client_request("/")
+def test_025(u, c):
+    base = u.rstrip("/")
+    urls = [u, base + "/query?test=testing", base + "/unicode", u]
+    rs = c.pipeline(urls)
+    t.eq(len(rs), 4)
+    t.eq(rs[0].body_string(), "welcome")
+    t.eq(rs[1].body_string(), "ok")
+    t.eq(rs[2].body_string(charset="utf-8"), u"éàù@")
+    t.eq(rs[3].body_string(), "welcome")
+
+    from restkit.client import Client
+    from restkit.wrappers import Request
+    c = Client(follow_redirect=True)
+    rs = c.pipeline([base + "/redirect",
+        Request(base + "/redirect", method="DELETE")])
+    t.eq(rs[0].body_string(), "ok")
+    t.eq(rs[1].status_int, 301)
+
+    c = Client(follow_redirect=True, force_follow_redirect=True)
+    rs = c.pipeline([Request(base + "/redirect", method="DELETE")])
+    t.eq(rs[0].status_int, 200)
+    t.eq(rs[0].request.method, "DELETE")
+
+def test_026():
+    from restkit.client import PipelineReader
+    from http_parser.http import HttpStream
+    data = ("HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nab"
+            "HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+            "3\r\ncde\r\n0\r\n\r\n"
+            "HTTP/1.1 204 No Content\r\n\r\n")
+
+    reader = PipelineReader(t.FakeSocket(t.StringIO(data)))
+    bodies = []
+    for i in range(3):
+        p = HttpStream(reader, kind=1)
+        reader.attach(p.parser)
+        bodies.append((p.status_code(), p.body_string()))
+    t.eq(bodies, [(200, "ab"), (200, "cde"), (204, "")])
+
+def test_027():
+    from restkit.client import Client, USER_AGENT
+    from restkit.wrappers import Request
+    c = Client()
+    req = Request("http://localhost:5984/db?a=b", method="POST",
+            headers=[("Accept", "*/*"), ("user-agent", "couchapp")])
+    hdrs = c.make_headers_string(req, [("Accept", "text/plain")])
+    t.eq(hdrs, "POST /db?a=b HTTP/1.1\r\n"
+            "Host: localhost:5984\r\n"
+            "User-Agent: couchapp\r\n"
+            "Accept-Encoding: identity\r\n"
+            "Accept: text/plain\r\n"
+            "Content-Length: 0\r\n\r\n")
+
+    req = Request("http://localhost:5984/", headers={"Host": "example.com"})
+    hdrs = c.make_headers_string(req)
+    t.eq(hdrs, "GET / HTTP/1.1\r\n"
+            "Host: example.com\r\n"
+            "User-Agent: %s\r\n"
+            "Accept-Encoding: identity\r\n\r\n" % USER_AGENT)
+
+def test_028():
+    from restkit.client import Client
+    from restkit.session import ConnectionPool
+    from restkit.conn import Connection
+    # connections are only opened, the server doesn't need to accept them
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind((t.HOST, 0))
+    server.listen(10)
+    u = "http://%s:%s/" % (t.HOST, server.getsockname()[1])
+
+    pool = ConnectionPool(factory=Connection, max_size=10)
+    c = Client(pool=pool)
+    try:
+        failures = c.warmup([u, u + "query"], per_host=3, concurrency=2)
+        t.eq(failures, [])
+        t.eq(pool.size, 3)
+
+        failures = c.warmup(["http://%s:1/" % t.HOST])
+        t.eq(len(failures), 1)
+        t.eq(failures[0][0], "http://%s:1/" % t.HOST)
+    finally:
+        pool.release_all()
+        server.close()
+
+@t.client_request("/")
+def test_029(u, c):
+    r = c.request(u)
+    timings = r.timings
+    t.eq(timings.reused, False)
+    t.eq(timings.retries, 0)
+    t.eq(timings.tls, None)
+    for phase in ('pool', 'dns', 'connect', 'send', 'ttfb', 'headers'):
+        t.eq(getattr(timings, phase) >= 0, True)
+    t.eq(timings.body, None)
+    t.eq(r.body_string(), "welcome")
+    t.eq(timings.body >= 0, True)
+
+    r = c.request(u, method="HEAD")
+    t.eq(r.timings is timings, False)
+
+@t.client_request("/")
+def test_030(u, c):
+    from restkit.client import Client
+    events = []
+
+    def hook(event):
+        return lambda *args: events.append(event)
+
+    c = Client(hooks={'connect_start': hook('connect_start'),
+        'body_complete': [hook('body_complete')]})
+    for event in ('pool_checkout', 'pool_checkin', 'connect_end',
+            'headers_sent', 'first_byte', 'response_headers'):
+        c.add_hook(event, hook(event))
+    t.raises(ValueError, c.add_hook, 'unknown', hook('unknown'))
+
+    r = c.request(u)
+    t.eq(r.body_string(), "welcome")
+    t.eq(events, ['connect_start', 'connect_end', 'pool_checkout',
+        'headers_sent', 'first_byte', 'response_headers', 'body_complete',
+        'pool_checkin'])
+
+    fn = c.hooks['connect_start'][0]
+    c.remove_hook('connect_start', fn)
+    t.eq('connect_start' in c.hooks, False)
+
+@t.client_request("/cookie")
+def test_031(u, c):
+    r = c.request(u)
+    t.eq('cookies' in r.__dict__, False)
+    t.eq(r.cookies.get('fig'), 'newton')
+    t.eq(r.cookies is r.cookies, True)
+    t.eq(r.headerslist, r.headers.items())
+    t.eq(r.location, None)
+
+    r = c.request(u.replace("/cookie", "/"))
+    t.eq(hasattr(r, 'cookies'), False)
+    t.eq(r['cookies'], None)
+
+@t.client_request('/large')
+def test_032(u, c):
+    content = "x" * (300 * 1024 + 7)
+    r = c.request(u, 'POST', body=content)
+    body = r.body_string()
+    t.eq(type(body), str)
+    t.eq(body, content)
+    t.raises(AlreadyRead, r.readinto, bytearray(10))
+
+    buf = bytearray(64 * 1024)
+    view = memoryview(buf)
+    for i in range(2):
+        r = c.request(u, 'POST', body=content)
+        parts = []
+        while True:
+            n = r.readinto(view)
+            if not n:
+                break
+            parts.append(str(buf[:n]))
+        t.eq("".join(parts), content)
+        t.raises(AlreadyRead, r.body_string)
+
+def test_033():
+    from restkit.breaker import CircuitBreaker, HALF_OPEN
+    from restkit.client import Client
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind((t.HOST, 0))
+    server.listen(10)
+    port = server.getsockname()[1]
+    u = "http://%s:%s/" % (t.HOST, port)
+
+    breaker = CircuitBreaker(max_failures=1, reset_timeout=0)
+    breaker.record((t.HOST, port), False)
+    c = Client(max_per_host=2, circuit_breaker=breaker)
+    try:
+        started = time.time()
+        t.eq(c.warmup([u], per_host=4), [])
+        t.eq(time.time() - started < 1, True)
+        stats = c.pool_stats()["hosts"]["%s:%s" % (t.HOST, port)]
+        t.eq(stats["idle"], 2)
+        t.eq(stats["created"], 2)
+
+        # the host is already warm
+        t.eq(c.warmup([u], per_host=2), [])
+        t.eq(c.pool_stats()["hosts"]["%s:%s" % (t.HOST, port)]["created"],
+                2)
+
+        # the half-open trial of the circuit isn't used by the warmup
+        t.eq(breaker.state(t.HOST, port), HALF_OPEN)
+        breaker.before_request((t.HOST, port))
+    finally:
+        c._pool.release_all()
+        server.close()
+
+    c = Client(max_per_host=2, pool_timeout=0.1)
+    t.eq(c.warmup(["http://%s:%s/" % (t.HOST, t.PORT)], per_host=3), [])
+    c._pool.release_all()
+
+@t.client_request("/")
+def test_034(u, c):
+    from restkit.client import Client
+    events = []
+
+    def hook(event):
+        return lambda *args: events.append(event)
+
+    c = Client(hooks=dict([(event, hook(event)) for event in
+        ('pool_checkout', 'headers_sent', 'first_byte', 'response_headers',
+            'body_complete', 'pool_checkin')]))
+    rs = c.pipeline([u, u.rstrip("/") + "/query?test=testing"])
+    # the test server closes the connection after the first response,
+    # the second request is sent again on a new connection.
+    t.eq(events, ['pool_checkout', 'headers_sent', 'headers_sent',
+        'first_byte', 'response_headers', 'pool_checkin',
+        'pool_checkout', 'headers_sent', 'first_byte', 'response_headers',
+        'pool_checkin'])
+
+    for r in rs:
+        timings = r.timings
+        t.eq(timings is not None, True)
+        for phase in ('pool', 'send', 'ttfb', 'headers', 'body'):
+            t.eq(getattr(timings, phase) >= 0, True)
+    t.eq(rs[0].timings.reused, False)
+    t.eq(rs[0].timings.connect >= 0, True)
+    t.eq(rs[0].timings is rs[1].timings, False)
+
+    t.eq(rs[0].body_string(), "welcome")
+    t.eq(events[-1], 'body_complete')
+
+def test_035():
+    from io import BytesIO
+    from http_parser.http import HttpStream
+    from restkit.client import Client, DetachedConnection
+    from restkit.wrappers import Response
+
+    class CacheFilter(object):
+        def on_request(self, request):
+            data = "HTTP/1.1 200 OK\r\nContent-Length: 6\r\n\r\ncached"
+            p = HttpStream(BytesIO(data), kind=1)
+            return Response(DetachedConnection(), request, p)
+
+    c = Client(filters=[CacheFilter()])
+    r = c.request("http://%s:%s/" % (t.HOST, t.PORT))
+    t.eq(r.body_string(), "cached")
+    t.eq(r.timings.send, None)
+    t.eq(r.timings.redirects, 0)
+    t.eq(c.pipeline(["http://%s:%s/" % (t.HOST, t.PORT)])[0].timings is \
+            None, False)
@@ -35,4 +35,21 @@ def test_002():
     t.eq(util.make_uri("http://localhost", "test/echo/"),
         "http://localhost/test/echo/")
     
-    
\ No newline at end of file
+    
+def test_003():
+    from restkit.wrappers import Request
+    u = util.URL("https://example.com:8443/a/b;p?q=1#f")
+    t.eq(u.scheme, "https")
+    t.eq(u.addr, ("example.com", 8443))
+    t.eq(u.is_ssl, True)
+    t.eq(u.host_header, "example.com:8443")
+    t.eq(u.request_path, "/a/b;p?q=1#f")
+    t.eq(u.pool_key, (("example.com", 8443), True))
+    t.eq(util.URL("http://example.com").request_path, "/")
+
+    req = Request("http://example.com/a")
+    parsed = req.parsed_url
+    t.eq(req.parsed_url is parsed, True)
+    req.url = "http://example.org/b"
+    t.eq(req.parsed_url.addr, ("example.org", 80))
+    t.eq(req.path, "/b")
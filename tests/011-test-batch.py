@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+import threading
+import time
+
+import t
+from restkit.batch import Executor, Future, as_completed
+from restkit.errors import RequestError
+
+from _server_test import HOST, PORT
+
+root_uri = "http://%s:%s" % (HOST, PORT)
+
+def test_001():
+    e = Executor(max_workers=2)
+    running = []
+    maxrunning = []
+    lock = threading.Lock()
+
+    def job(i):
+        with lock:
+            running.append(i)
+            maxrunning.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.remove(i)
+        return i * 2
+
+    futures = [e.submit(job, i) for i in range(6)]
+    e.shutdown()
+    t.eq([f.result() for f in futures], [0, 2, 4, 6, 8, 10])
+    t.eq(max(maxrunning) <= 2, True)
+
+def test_002():
+    e = Executor(max_workers=2)
+
+    def job():
+        raise ValueError("boom")
+
+    f = e.submit(job)
+    t.raises(ValueError, f.result)
+    t.eq(isinstance(f.exception(), ValueError), True)
+    t.eq(f.done(), True)
+
+def test_003():
+    e = Executor(max_workers=3)
+    futures = [e.submit(time.sleep, d) for d in (0.2, 0.1, 0)]
+    done = list(as_completed(futures))
+    t.eq(done[0], futures[2])
+    t.eq(done[-1], futures[0])
+
+@t.client_request("/")
+def test_004(u, c):
+    f = c.submit(u)
+    t.eq(f.result().body_string(), "welcome")
+
+@t.client_request("/")
+def test_005(u, c):
+    urls = [u, {'url': root_uri + "/json", 'method': 'POST', 'body': 'test',
+        'headers': {'Content-Type': 'application/json'}},
+        "http://%s:1/" % HOST]
+    futures = list(c.map(urls, concurrency=2, ordered=True))
+    t.eq(len(futures), 3)
+    t.eq(futures[0].result().body_string(), "welcome")
+    t.eq(futures[1].result().status_int, 200)
+    t.eq(isinstance(futures[2].exception(), RequestError), True)
+
+    futures = list(c.map([u] * 5, concurrency=2))
+    t.eq([f.result().status_int for f in futures], [200] * 5)
+
+def test_006():
+    f = Future(threading.Event, threading.Lock)
+    called = []
+    finisher = threading.Thread(target=f.set_result, args=(1,))
+
+    # the job finishes between the done() check and the registration of
+    # the callback.
+    def done():
+        is_done = f._event.is_set()
+        finisher.start()
+        time.sleep(0.1)
+        return is_done
+    f.done = done
+
+    f.add_done_callback(called.append)
+    finisher.join()
+    t.eq(called, [f])
+
+def test_007():
+    from restkit.client import Client
+    c = Client(follow_redirect=True, max_follow_redirect=1)
+    futures = list(c.map([root_uri + "/redirect"] * 40, concurrency=10))
+    t.eq([f.exception() for f in futures], [None] * 40)
+    for f in futures:
+        r = f.result()
+        t.eq(r.body_string(), "ok")
+        t.eq(r.timings.redirects, 1)
+
+def test_008():
+    from restkit.client import Client
+    from restkit.pool import ConnectionPool
+    from restkit.conn import Connection
+    pool = ConnectionPool(Connection, max_per_host=2, pool_timeout=2)
+    c = Client(pool=pool)
+    futures = list(c.map([root_uri + "/"] * 10, concurrency=2))
+    t.eq([f.exception() for f in futures], [None] * 10)
+    t.eq([f.result().body_string() for f in futures], ["welcome"] * 10)
+    t.eq(pool.stats()["total"]["in_use"], 0)
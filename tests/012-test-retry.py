@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+import time
+
+import t
+from restkit.client import Client
+from restkit.retry import RetryPolicy, RetryBudget, RETRY_STATUSES, \
+parse_retry_after
+from restkit.util import http_date
+
+from _server_test import HOST, PORT
+
+root_uri = "http://%s:%s" % (HOST, PORT)
+
+def test_001():
+    p = RetryPolicy(backoff=0.5, backoff_factor=2, max_backoff=3)
+    t.eq([p.get_backoff(i) for i in range(5)], [0.5, 1, 2, 3, 3])
+
+    p = RetryPolicy(backoff=1, backoff_factor=2, jitter=True)
+    for i in range(20):
+        d = p.get_backoff(3)
+        t.eq(0 <= d <= 8, True)
+
+def test_002():
+    t.eq(parse_retry_after("120"), 120)
+    t.eq(parse_retry_after(""), None)
+    t.eq(parse_retry_after("soon"), None)
+    d = parse_retry_after(http_date(time.time() + 60))
+    t.eq(55 < d <= 60, True)
+    t.eq(parse_retry_after(http_date(time.time() - 60)), 0)
+
+def test_003():
+    b = RetryBudget(ratio=0.5, min_retries_per_sec=0, ttl=10)
+    for i in range(4):
+        b.deposit()
+    t.eq([b.withdraw() for i in range(3)], [True, True, False])
+
+def test_004():
+    c = Client(retry_policy=RetryPolicy(retry_statuses=RETRY_STATUSES,
+        backoff=10))
+    r = c.request(root_uri + "/retry?key=004&tries=3")
+    t.eq(r.status_int, 200)
+    t.eq(r.body_string(), "3")
+
+def test_005():
+    c = Client(retry_policy=RetryPolicy(max_tries=1,
+        retry_statuses=RETRY_STATUSES))
+    r = c.request(root_uri + "/retry?key=005&tries=3")
+    t.eq(r.status_int, 503)
+
+    # method not retried on status
+    c = Client(retry_policy=RetryPolicy(retry_statuses=RETRY_STATUSES,
+        status_methods=()))
+    r = c.request(root_uri + "/retry?key=005b&tries=2")
+    t.eq(r.status_int, 503)
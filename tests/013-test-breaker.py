@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+import time
+
+import t
+from restkit.breaker import CircuitBreaker, CLOSED, OPEN, HALF_OPEN
+from restkit.client import Client
+from restkit.errors import CircuitBreakerOpen, RequestError
+
+from _server_test import HOST, PORT
+
+def test_001():
+    b = CircuitBreaker(max_failures=3, reset_timeout=0.2)
+    addr = ("example.com", 80)
+    for i in range(3):
+        b.before_request(addr)
+        b.record(addr, False)
+    t.eq(b.state(*addr), OPEN)
+    t.raises(CircuitBreakerOpen, b.before_request, addr)
+
+    time.sleep(0.25)
+    t.eq(b.state(*addr), HALF_OPEN)
+    b.before_request(addr)
+    # only one trial request in half-open state
+    t.raises(CircuitBreakerOpen, b.before_request, addr)
+    b.record(addr, True)
+    t.eq(b.state(*addr), CLOSED)
+    t.eq(b.stats()["example.com:80"]["rejected"], 2)
+
+def test_002():
+    b = CircuitBreaker(max_failures=0, failure_rate=0.5, min_requests=4,
+            failure_statuses=(503,))
+    addr = ("example.com", 80)
+    for status in (200, 503, 200):
+        b.record_response(addr, status)
+    t.eq(b.state(*addr), CLOSED)
+    b.record_response(addr, 503)
+    t.eq(b.state(*addr), OPEN)
+
+def test_003():
+    b = CircuitBreaker(max_failures=2, reset_timeout=60)
+    c = Client(circuit_breaker=b)
+    u = "http://%s:1/" % HOST
+    t.raises(RequestError, c.request, u)
+    t.raises(RequestError, c.request, u)
+    t.raises(CircuitBreakerOpen, c.request, u)
+    t.eq(b.state(HOST, 1), OPEN)
+
+    # other hosts are not affected
+    r = c.request("http://%s:%s/" % (HOST, PORT))
+    t.eq(r.body_string(), "welcome")
+
+def test_004():
+    b = CircuitBreaker(max_failures=1, reset_timeout=0.1)
+    c = Client(circuit_breaker=b)
+    u = "http://%s:%s/" % (HOST, PORT)
+    addr = (HOST, PORT)
+    b.record(addr, False)
+    time.sleep(0.15)
+    t.eq(b.state(*addr), HALF_OPEN)
+
+    # the trial fails before the request is sent, the host isn't to
+    # blame and the trial is given back.
+    t.raises(RequestError, c.request, u, 'POST', body=["a", "b"])
+    t.eq(b.state(*addr), HALF_OPEN)
+
+    r = c.request(u)
+    t.eq(r.body_string(), "welcome")
+    t.eq(b.state(*addr), CLOSED)
+
+    # errors of the caller don't open the circuit
+    for i in range(3):
+        t.raises(RequestError, c.request, u, 'POST', body=["a", "b"])
+    t.eq(b.state(*addr), CLOSED)
+    t.eq(c.request(u).body_string(), "welcome")
+
+def test_005():
+    b = CircuitBreaker(max_failures=1, reset_timeout=0.1)
+    addr = ("example.com", 80)
+    b.record(addr, False)
+    time.sleep(0.15)
+    b.before_request(addr)
+    t.raises(CircuitBreakerOpen, b.before_request, addr)
+
+    # the result of the trial is never recorded
+    time.sleep(0.15)
+    b.before_request(addr)
+    t.eq(b.state(*addr), HALF_OPEN)
+    b.record(addr, True)
+    t.eq(b.state(*addr), CLOSED)
+
+def test_006():
+    from restkit.conn import Connection
+    from restkit.errors import PoolTimeout
+    from restkit.pool import ConnectionPool
+    b = CircuitBreaker(max_failures=1)
+    pool = ConnectionPool(Connection, max_per_host=1, pool_timeout=0.1)
+    c = Client(circuit_breaker=b, pool=pool)
+    u = "http://%s:%s/" % (HOST, PORT)
+
+    # the local pool is full, the host isn't failing
+    r = c.request(u)
+    t.raises(PoolTimeout, c.request, u)
+    t.eq(b.state(HOST, PORT), CLOSED)
+    t.eq(r.body_string(), "welcome")
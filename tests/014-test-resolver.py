@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+import socket
+import time
+
+import t
+from socketpool.util import load_backend
+from restkit.client import Client
+from restkit.conn import Connection
+from restkit.resolver import Resolver
+
+from _server_test import HOST, PORT
+
+class FakeResolver(object):
+
+    def __init__(self):
+        self.calls = []
+        self.fail = False
+
+    def __call__(self, host, port, family=0, socktype=0):
+        self.calls.append(host)
+        if self.fail:
+            raise socket.gaierror(-2, "Name or service not known")
+        return socket.getaddrinfo("127.0.0.1", port, family, socktype)
+
+def test_001():
+    fake = FakeResolver()
+    r = Resolver(ttl=0.2, refresh_ahead=None, resolver=fake)
+    addrs = r.resolve("example.com", 80)
+    t.eq(addrs[0][4], ("127.0.0.1", 80))
+    r.resolve("example.com", 80)
+    t.eq(len(fake.calls), 1)
+    time.sleep(0.25)
+    r.resolve("example.com", 80)
+    t.eq(len(fake.calls), 2)
+
+def test_002():
+    fake = FakeResolver()
+    fake.fail = True
+    r = Resolver(negative_ttl=60, resolver=fake)
+    t.raises(socket.gaierror, r.resolve, "example.com", 80)
+    t.raises(socket.gaierror, r.resolve, "example.com", 80)
+    t.eq(len(fake.calls), 1)
+
+def test_003():
+    fake = FakeResolver()
+    r = Resolver(ttl=1, refresh_ahead=0.1, resolver=fake)
+    r.resolve("example.com", 80)
+    time.sleep(0.15)
+    # the cached value is used while the entry is refreshed
+    fake.fail = True
+    t.eq(r.resolve("example.com", 80)[0][4], ("127.0.0.1", 80))
+    time.sleep(0.05)
+    t.eq(len(fake.calls), 2)
+    t.eq(r.resolve("example.com", 80)[0][4], ("127.0.0.1", 80))
+
+def test_004():
+    fake = FakeResolver()
+    c = Client(resolver=Resolver(resolver=fake))
+    r = c.request("http://restkit.test:%s/" % PORT)
+    t.eq(r.body_string(), "welcome")
+    t.eq(fake.calls, ["restkit.test"])
+
+def test_005():
+    # the address is resolved again when it refuses connections
+    fake = FakeResolver()
+    r = Resolver(resolver=fake)
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("127.0.0.1", 0))
+    port = server.getsockname()[1]
+    server.close()
+    t.raises(socket.error, Connection, "restkit.test", port,
+            backend_mod=load_backend("thread"), resolver=r)
+    r.resolve("restkit.test", port)
+    t.eq(fake.calls, ["restkit.test", "restkit.test"])
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+import os
+import socket
+import ssl
+import threading
+
+import t
+from restkit import tls
+from restkit.client import Client
+from restkit.errors import RequestError
+
+CERT = os.path.join(t.dirname, "_tls_test.pem")
+
+def test_001():
+    args = {'cert_reqs': 0, 'do_handshake_on_connect': True,
+            'server_hostname': 'example.com'}
+    t.eq(tls.context_args(args), {'cert_reqs': 0})
+    t.eq(tls.ssl_args_key({'cert_reqs': 0, 'ca_certs': None}),
+            (('ca_certs', None), ('cert_reqs', 0)))
+
+def test_002():
+    if not tls.HAS_SSL_CONTEXT:
+        return
+    args = {'cert_reqs': 0}
+    ctx = tls.get_ssl_context(args)
+    t.eq(tls.get_ssl_context({'cert_reqs': 0}) is ctx, True)
+    t.eq(tls.get_ssl_context({'cert_reqs': 1}) is ctx, False)
+
+
+def tls_server():
+    """ start an HTTPS server answering "ok" on keep-alive connections,
+    return its url and the host names received with SNI """
+    ctx = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+    ctx.load_cert_chain(CERT)
+    names = []
+    ctx.set_servername_callback(lambda sock, name, ctx: names.append(name))
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind((t.HOST, 0))
+    server.listen(5)
+
+    def handle(peer):
+        try:
+            peer = ctx.wrap_socket(peer, server_side=True)
+            data = ""
+            while True:
+                chunk = peer.recv(4096)
+                if not chunk:
+                    break
+                data += chunk
+                while "\r\n\r\n" in data:
+                    data = data.split("\r\n\r\n", 1)[1]
+                    peer.sendall("HTTP/1.1 200 OK\r\n"
+                            "Content-Length: 2\r\n\r\nok")
+        except (socket.error, ssl.SSLError):
+            pass
+        finally:
+            peer.close()
+
+    def run():
+        while True:
+            peer, _ = server.accept()
+            th = threading.Thread(target=handle, args=(peer,))
+            th.daemon = True
+            th.start()
+
+    th = threading.Thread(target=run)
+    th.daemon = True
+    th.start()
+    return "https://localhost:%s/" % server.getsockname()[1], names
+
+def verifying_context(ca_certs=None):
+    ctx = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+    ctx.verify_mode = ssl.CERT_REQUIRED
+    if ca_certs is not None:
+        ctx.load_verify_locations(ca_certs)
+    return ctx
+
+def test_003():
+    if not tls.HAS_SSL_CONTEXT:
+        return
+    url, names = tls_server()
+    c = Client(max_tries=1)
+    t.eq(c.request(url).body_string(), "ok")
+    if tls.HAS_SNI:
+        t.eq(names, ["localhost"])
+
+    # the connection opened without verification isn't reused by a client
+    # verifying the certificate
+    strict = Client(ssl_context=verifying_context(), max_tries=1)
+    t.raises(RequestError, strict.request, url)
+
+    trusted = Client(ssl_context=verifying_context(CERT), max_tries=1)
+    t.eq(trusted.request(url).body_string(), "ok")
+    t.eq(trusted.request(url).body_string(), "ok")
+    t.eq(c.request(url).body_string(), "ok")
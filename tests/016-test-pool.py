@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+import threading
+import time
+
+import t
+from restkit import Client
+from restkit.errors import PoolTimeout, ProxyError
+from restkit.pool import ConnectionPool
+
+
+class FakeConnection(object):
+
+    connecting = 0
+    max_connecting = 0
+
+    def __init__(self, host=None, port=None, backend_mod=None, pool=None,
+            delay=0, tunnel=None):
+        FakeConnection.connecting += 1
+        FakeConnection.max_connecting = max(FakeConnection.max_connecting,
+                FakeConnection.connecting)
+        time.sleep(delay)
+        FakeConnection.connecting -= 1
+        self.host = host
+        self.port = port
+        self.tunnel = tunnel
+        self._connected = True
+        self._life = time.time()
+        self.last_used = time.time()
+        self.bytes_sent = self.bytes_received = 0
+
+    def matches(self, **options):
+        return options.get('host') == self.host and \
+                options.get('port') == self.port and \
+                options.get('tunnel') == self.tunnel
+
+    def is_connected(self):
+        return self._connected
+
+    def invalidate(self):
+        self._connected = False
+
+    def get_lifetime(self):
+        return self._life
+
+
+def make_pool(**options):
+    return ConnectionPool(factory=FakeConnection, reap_connections=False,
+            **options)
+
+def test_001():
+    pool = make_pool(max_per_host=1, pool_timeout=0.1)
+    conn = pool.get(host="a", port=80)
+    t.raises(PoolTimeout, pool.get, host="a", port=80)
+
+    # other hosts aren't limited
+    other = pool.get(host="b", port=80)
+    t.eq(other is conn, False)
+
+    pool.release_connection(conn)
+    t.eq(pool.get(host="a", port=80) is conn, True)
+
+    # a closed connection frees its slot
+    conn.invalidate()
+    pool.release_connection(conn)
+    new_conn = pool.get(host="a", port=80)
+    t.eq(new_conn is conn, False)
+    t.eq(pool.stats()["hosts"]["a:80"]["in_use"], 1)
+
+def test_002():
+    pool = make_pool(max_per_host=1, pool_timeout=5)
+    conn = pool.get(host="a", port=80)
+    order = []
+
+    def wait(i):
+        c = pool.get(host="a", port=80)
+        order.append(i)
+        time.sleep(0.01)
+        pool.release_connection(c)
+
+    threads = []
+    for i in range(3):
+        th = threading.Thread(target=wait, args=(i,))
+        th.start()
+        threads.append(th)
+        time.sleep(0.05)
+
+    t.eq(pool.stats()["hosts"]["a:80"]["waiting"], 3)
+    pool.release_connection(conn)
+    for th in threads:
+        th.join()
+    t.eq(order, [0, 1, 2])
+
+def test_003():
+    FakeConnection.max_connecting = 0
+    pool = make_pool(max_connecting=2, max_size=20)
+    conns = []
+
+    def connect():
+        conns.append(pool.get(host="c", port=80, delay=0.05))
+
+    threads = [threading.Thread(target=connect) for i in range(6)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    t.eq(FakeConnection.max_connecting, 2)
+    t.eq(pool.stats()["hosts"]["c:80"]["in_use"], 6)
+
+def test_004():
+    pool = make_pool(idle_timeout=0.05, max_lifetime=0.5)
+    conn = pool.get(host="a", port=80)
+    conn.last_used = time.time()
+    pool.release_connection(conn)
+    t.eq(pool.get(host="a", port=80) is conn, True)
+
+    # idle for too long
+    pool.release_connection(conn)
+    t.eq(pool.size, 1)
+    conn.last_used = time.time() - 1
+    t.eq(pool.get(host="a", port=80) is conn, False)
+    t.eq(conn.is_connected(), False)
+
+    # opened for too long
+    conn = pool.get(host="b", port=80)
+    conn._life = time.time() - 1
+    pool.release_connection(conn)
+    t.eq(pool.size, 0)
+    t.eq(conn.is_connected(), False)
+
+def test_005():
+    pool = ConnectionPool(factory=FakeConnection, idle_timeout=0.05,
+            reap_delay=0.05)
+    conn = pool.get(host="a", port=80)
+    pool.release_connection(conn)
+    t.eq(pool.size, 1)
+    time.sleep(0.3)
+    t.eq(pool.size, 0)
+    t.eq(conn.is_connected(), False)
+
+@t.client_request("/")
+def test_006(u, c):
+    c = Client(max_per_host=1, pool_timeout=5)
+    for i in range(3):
+        r = c.request(u)
+        t.eq(r.body_string(), "welcome")
+    t.eq(isinstance(c._pool, ConnectionPool), True)
+    stats = c.pool_stats()
+    t.eq(stats["total"]["created"], 3)
+    t.eq(stats["total"]["in_use"], 0)
+    t.eq(stats["total"]["bytes_received"] > 0, True)
+    t.eq(stats["total"]["bytes_sent"] > 0, True)
+
+def test_007():
+    pool = make_pool()
+    conn = pool.get(host="a", port=80)
+    t.eq(pool.stats()["hosts"]["a:80"]["in_use"], 1)
+    conn.bytes_sent = 10
+    conn.bytes_received = 20
+    pool.release_connection(conn)
+    pool.get(host="a", port=80)
+    stats = pool.stats()
+    host = stats["hosts"]["a:80"]
+    t.eq(host["created"], 1)
+    t.eq(host["reused"], 1)
+    t.eq(host["reuse_ratio"], 0.5)
+    t.eq(host["bytes_sent"], 10)
+    t.eq(host["bytes_received"], 20)
+    t.eq(sum(host["wait_times"].values()), 2)
+    t.eq(stats["total"]["in_use"], 1)
+    t.eq(stats["total"]["idle"], 0)
+
+def test_008():
+    pool = make_pool(max_per_host=2, pool_timeout=0.1)
+    conn = pool.get(host="a", port=80)
+    pool.release_connection(conn)
+
+    # idle connections aren't reused
+    new = pool.connect(host="a", port=80)
+    t.eq(new is conn, False)
+    pool.release_connection(new)
+
+    # the host is full of idle connections
+    t.eq(pool.connect(host="a", port=80), None)
+    t.eq(pool.stats()["hosts"]["a:80"]["idle"], 2)
+    t.eq(pool.stats()["hosts"]["a:80"]["created"], 2)
+
+def test_009():
+    # tunnels through a proxy are limited by the host they reach
+    pool = make_pool(max_per_host=1, pool_timeout=0.1)
+    proxy = dict(host="proxy", port=3128)
+    a = pool.get(tunnel=("a", 443), **proxy)
+    b = pool.get(tunnel=("b", 443), **proxy)
+    t.eq(a is b, False)
+    t.raises(PoolTimeout, pool.get, tunnel=("a", 443), **proxy)
+    pool.release_connection(b)
+    t.eq(pool.get(tunnel=("b", 443), **proxy) is b, True)
+    hosts = pool.stats()["hosts"]
+    t.eq(sorted(hosts), ["a:443 via proxy:3128", "b:443 via proxy:3128"])
+    t.eq(hosts["b:443 via proxy:3128"]["reused"], 1)
+
+def test_010():
+    calls = []
+    def factory(**options):
+        calls.append(options)
+        raise ProxyError("tunnel connection to a:443 failed: 407")
+    pool = ConnectionPool(factory=factory, reap_connections=False,
+            retry_max=3)
+    t.raises(ProxyError, pool.get, host="proxy", port=3128,
+            tunnel=("a", 443))
+    t.eq(len(calls), 1)
+    stats = pool.stats()["hosts"]["a:443 via proxy:3128"]
+    t.eq(stats["connect_failures"], 1)
+    t.eq(stats["connecting"], 0)
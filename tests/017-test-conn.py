@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+import os
+import socket
+from StringIO import StringIO
+import tempfile
+import threading
+import time
+
+import t
+from socketpool.util import load_backend
+from restkit import conn as connmod
+from restkit.conn import Connection, CHUNK_SIZE, MAX_COALESCE, \
+        chunk_buffers
+from restkit.errors import ProxyError
+
+
+def connect(**options):
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind((t.HOST, 0))
+    server.listen(1)
+    conn = Connection(t.HOST, server.getsockname()[1],
+            backend_mod=load_backend("thread"), **options)
+    peer, _ = server.accept()
+    server.close()
+    return conn, peer
+
+def test_001():
+    conn, peer = connect()
+    t.eq(conn.is_connected(), True)
+
+    # idle connections are checked
+    conn.last_used = time.time() - 10
+    t.eq(conn.is_connected(), True)
+
+    # unexpected data
+    peer.send("HTTP/1.1 408 Request Timeout\r\n\r\n")
+    time.sleep(0.05)
+    t.eq(conn.is_connected(), False)
+    conn.close()
+    peer.close()
+
+def test_002():
+    conn, peer = connect()
+    peer.close()
+    time.sleep(0.05)
+    # released recently, the socket isn't checked
+    t.eq(conn.is_connected(), True)
+    conn.last_used = time.time() - 10
+    t.eq(conn.is_connected(), False)
+
+    conn.stale_check_after = None
+    t.eq(conn.is_connected(), True)
+    conn.close()
+
+def fake_proxy(reply):
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind((t.HOST, 0))
+    server.listen(1)
+    received = []
+
+    def run():
+        peer, _ = server.accept()
+        data = ""
+        while "\r\n\r\n" not in data:
+            data += peer.recv(1024)
+        received.append(data)
+        peer.sendall(reply)
+        received.append(peer)
+        server.close()
+
+    th = threading.Thread(target=run)
+    th.start()
+    return server.getsockname()[1], received, th
+
+def test_003():
+    port, received, th = fake_proxy(
+            "HTTP/1.1 200 Connection established\r\n\r\n")
+    conn = Connection(t.HOST, port, backend_mod=load_backend("thread"),
+            tunnel=("example.com", 443),
+            tunnel_headers=[("Proxy-Authorization", "Basic xxx")])
+    th.join()
+    t.eq(received[0], "CONNECT example.com:443 HTTP/1.1\r\n"
+            "Host: example.com:443\r\n"
+            "Proxy-Authorization: Basic xxx\r\n\r\n")
+
+    # connections are pooled by proxy and tunnel
+    t.eq(conn.matches(host=t.HOST, port=port,
+        tunnel=("example.com", 443)), True)
+    t.eq(conn.matches(host=t.HOST, port=port,
+        tunnel=("example.org", 443)), False)
+    t.eq(conn.matches(host=t.HOST, port=port), False)
+
+    # data goes through the tunnel
+    conn.send("ping")
+    t.eq(received[1].recv(4), "ping")
+    conn.close()
+    received[1].close()
+
+def test_004():
+    port, received, th = fake_proxy(
+            "HTTP/1.1 407 Proxy Authentication Required\r\n"
+            "Content-Length: 0\r\n\r\n")
+    t.raises(ProxyError, Connection, t.HOST, port,
+            backend_mod=load_backend("thread"),
+            tunnel=("example.com", 443))
+    th.join()
+    received[1].close()
+
+
+def make_file(size):
+    f = tempfile.TemporaryFile()
+    f.write("".join([chr(i % 256) for i in range(256)]) * (size // 256))
+    f.flush()
+    f.seek(0)
+    return f
+
+def read_all(sock, size, delay=0):
+    """ read size bytes from sock in a thread """
+    received = []
+
+    def run():
+        time.sleep(delay)
+        data = []
+        while size - sum(map(len, data)) > 0:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data.append(chunk)
+        received.append("".join(data))
+
+    th = threading.Thread(target=run)
+    th.start()
+    return received, th
+
+class CountingSendfile(object):
+
+    def __init__(self, sendfile):
+        self.sendfile = sendfile
+        self.calls = 0
+
+    def __call__(self, *args):
+        self.calls += 1
+        return self.sendfile(*args)
+
+class CountingBackend(object):
+
+    def __init__(self, backend_mod):
+        self.backend_mod = backend_mod
+        self.selects = 0
+
+    def __getattr__(self, name):
+        return getattr(self.backend_mod, name)
+
+    def Select(self, *args):
+        self.selects += 1
+        return self.backend_mod.Select(*args)
+
+class PipeBody(object):
+
+    def __init__(self, f):
+        self.f = f
+
+    def fileno(self):
+        return self.f.fileno()
+
+    def read(self, size=-1):
+        return self.f.read(size)
+
+def with_sendfile(func):
+    def run():
+        counter = CountingSendfile(connmod.sendfile)
+        connmod.sendfile = counter
+        try:
+            func(counter)
+        finally:
+            connmod.sendfile = counter.sendfile
+    run.func_name = func.func_name
+    return run
+
+@with_sendfile
+def test_005(counter):
+    conn, peer = connect()
+    f = make_file(256 * 1024)
+    expected = f.read()
+    # the body is sent from the start
+    f.seek(1000)
+    received, th = read_all(peer, len(expected))
+    conn.sendfile(f)
+    th.join()
+    t.eq(received[0] == expected, True)
+    t.eq(counter.calls > 0, True)
+    t.eq(conn.bytes_sent, len(expected))
+    t.eq(f.tell(), len(expected))
+    conn.close()
+    peer.close()
+
+@with_sendfile
+def test_006(counter):
+    conn, peer = connect()
+    f = make_file(64 * 1024)
+    expected = f.read()[1000:]
+    f.seek(1000)
+    received, th = read_all(peer, len(expected))
+    t.eq(conn._sendfile(f), True)
+    th.join()
+    t.eq(received[0] == expected, True)
+    t.eq(conn.bytes_sent, len(expected))
+    t.eq(f.tell(), 64 * 1024)
+    conn.close()
+    peer.close()
+
+@with_sendfile
+def test_007(counter):
+    # sockets with a timeout are non blocking, sendfile waits until
+    # they are writable.
+    conn, peer = connect()
+    conn.socket().settimeout(5)
+    conn.backend_mod = CountingBackend(conn.backend_mod)
+    f = make_file(16 * 1024 * 1024)
+    expected = f.read()
+    received, th = read_all(peer, len(expected), delay=0.2)
+    conn.sendfile(f)
+    th.join()
+    t.eq(received[0] == expected, True)
+    t.eq(conn.backend_mod.selects > 0, True)
+    conn.close()
+    peer.close()
+
+@with_sendfile
+def test_008(counter):
+    conn, peer = connect()
+    conn.socket().settimeout(0.2)
+    f = make_file(16 * 1024 * 1024)
+    t.raises(socket.timeout, conn.sendfile, f)
+    conn.close()
+    peer.close()
+
+@with_sendfile
+def test_009(counter):
+    def check(body, expected, chunked=False, is_ssl=False):
+        conn, peer = connect()
+        conn.is_ssl = is_ssl
+        received, th = read_all(peer, len(expected))
+        conn.sendfile(body, chunked)
+        th.join()
+        t.eq(received[0] == expected, True)
+        conn.close()
+        peer.close()
+
+    f = make_file(1024)
+    content = f.read()
+
+    # chunked bodies
+    check(f, "400\r\n" + content + "\r\n", chunked=True)
+    # tls connections, only the read and send loop is used
+    check(f, content, is_ssl=True)
+    # objects without fileno
+    check(StringIO(content), content)
+    # non regular files, pipes can't be rewound
+    r, w = os.pipe()
+    os.write(w, content)
+    os.close(w)
+    check(PipeBody(os.fdopen(r)), content)
+    t.eq(counter.calls, 0)
+
+class RecordingSocket(object):
+
+    def __init__(self):
+        self.calls = []
+
+    def sendall(self, data):
+        self.calls.append(data)
+
+def test_010():
+    conn, peer = connect()
+    sock = conn._s
+    conn._s = RecordingSocket()
+
+    # small buffers are sent with one call
+    conn.sendv(["GET / HTTP/1.1\r\n\r\n", "", "body"])
+    t.eq(conn._s.calls, ["GET / HTTP/1.1\r\n\r\nbody"])
+
+    conn._s.calls = []
+    body = "x" * MAX_COALESCE
+    conn.sendv(["headers\r\n\r\n", body])
+    t.eq(conn._s.calls, ["headers\r\n\r\n", body])
+    t.eq(conn.bytes_sent, 22 + 11 + MAX_COALESCE)
+
+    conn._s.calls = []
+    conn.sendv([])
+    t.eq(conn._s.calls, [])
+
+    # a full chunk is sent with its framing in one call
+    conn._s.calls = []
+    data = "x" * CHUNK_SIZE
+    conn.send_chunk(data)
+    t.eq(conn._s.calls, ["4000\r\n" + data + "\r\n"])
+
+    # small buffers around a large one are joined with their neighbours
+    conn._s.calls = []
+    body = "x" * (MAX_COALESCE + 1)
+    conn.sendv(["headers\r\n\r\n"] + chunk_buffers(body) +
+            chunk_buffers(""))
+    t.eq(conn._s.calls, ["headers\r\n\r\n%X\r\n" % len(body), body,
+        "\r\n0\r\n\r\n"])
+
+    conn._s = sock
+    conn.close()
+    peer.close()
+
+def test_011():
+    t.eq(chunk_buffers("abc"), ["3\r\n", "abc", "\r\n"])
+    t.eq(chunk_buffers("x" * 26), ["1A\r\n", "x" * 26, "\r\n"])
+    t.eq(chunk_buffers(""), ["0\r\n", "", "\r\n"])
+
+    conn, peer = connect()
+    conn.send_chunk("hello")
+    conn.send_chunk("")
+    t.eq(peer.recv(1024), "5\r\nhello\r\n0\r\n\r\n")
+    conn.close()
+    peer.close()
+
+def test_012():
+    # the socket timeout doesn't apply to the check
+    conn, peer = connect()
+    conn.socket().settimeout(5)
+    conn.last_used = time.time() - 10
+    started = time.time()
+    t.eq(conn.is_connected(), True)
+    t.eq(time.time() - started < 1, True)
+    t.eq(conn.socket().gettimeout(), 5)
+
+    peer.close()
+    time.sleep(0.05)
+    t.eq(conn.is_connected(), False)
+    conn.close()
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+import t
+from restkit.datastructures import Headers, MultiDict
+
+
+def test_001():
+    h = Headers([("Accept", "text/plain"), ("X-Foo", "1")])
+    h.add("x-foo", "2")
+    t.eq(h.iget("ACCEPT"), "text/plain")
+    t.eq(h.iget("x-foo"), "1")
+    t.eq(h.igetall("X-FOO"), ["1", "2"])
+    t.eq(h.getall("X-Foo"), ["1"])
+    t.eq(h["x-foo"], "2")
+    t.raises(KeyError, h.__getitem__, "X-FOO")
+    t.eq("X-Foo" in h, True)
+    t.eq("x-FOO" in h, False)
+    t.eq(h.icontains("x-FOO"), True)
+    t.eq(h.iget("missing"), None)
+
+    h["Accept"] = "*/*"
+    t.eq(h.items(), [("X-Foo", "1"), ("x-foo", "2"), ("Accept", "*/*")])
+
+    t.eq(h.ipop("X-FOO"), "1")
+    t.eq(h.iget("x-foo"), "2")
+    t.eq(h.ipop("missing", None), None)
+    t.raises(KeyError, h.ipop, "missing")
+
+    del h["x-foo"]
+    t.eq(h.icontains("x-foo"), False)
+    t.eq(h.items(), [("Accept", "*/*")])
+    t.eq(h.pop("Accept"), "*/*")
+    t.eq(len(h), 0)
+
+def test_002():
+    h = Headers({"a": "1"})
+    h.update({"B": "2"})
+    t.eq(h.iget("b"), "2")
+    t.eq(Headers(MultiDict([("c", "3")])).iget("C"), "3")
+    c = h.copy()
+    c.add("d", "4")
+    t.eq(h.icontains("d"), False)
+    t.eq(h.setdefault("A", "5"), "5")
+    t.eq(h.setdefault("a", "6"), "1")
+    t.eq(h.popitem(), ("A", "5"))
+    t.eq(h.iget("a"), "1")
+
+def test_003():
+    h = Headers([("Host", "example.com"), ("Accept", "*/*"),
+        ("X-Num", 1)])
+    t.eq(h.serialize(), "Host: example.com\r\nAccept: */*\r\nX-Num: 1\r\n")
+    t.eq(h.serialize(set(["host", "user-agent"])),
+            "Accept: */*\r\nX-Num: 1\r\n")
+
+def test_004():
+    # repeated names, before and after the index is built
+    h = Headers([("Set-Cookie", "a"), ("X", "1"), ("set-cookie", "b")])
+    h.add("SET-COOKIE", "c")
+    t.eq(h.igetall("set-cookie"), ["a", "b", "c"])
+    t.eq(h.ipop("Set-cookie"), "a")
+    t.eq(h.iget("set-cookie"), "b")
+    del h["set-cookie"]
+    t.eq(h.igetall("SET-COOKIE"), ["c"])
+    h.extend([("x", "2"), ("Set-Cookie", "d")])
+    t.eq(h.igetall("x"), ["1", "2"])
+    t.eq(h["Set-Cookie"], "d")
+    t.eq(h.items(), [("X", "1"), ("SET-COOKIE", "c"), ("x", "2"),
+        ("Set-Cookie", "d")])
+    t.eq(h.popitem(), ("Set-Cookie", "d"))
+    t.eq(h.igetall("set-cookie"), ["c"])
+    h.clear()
+    h.add("A", "1")
+    t.eq(h.iget("a"), "1")
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -
+#
+# This file is part of restkit released under the MIT license.
+# See the NOTICE for more information.
+
+import json
+from StringIO import StringIO
+
+import t
+from restkit.jsonstream import iter_json
+
+DOC = json.dumps({
+    "total_rows": 3,
+    "offset": 0,
+    "meta": {"rows": [{"id": "skipped"}]},
+    "rows": [
+        {"id": "a", "key": [1, "x"], "value": {"rev": "1-a"}},
+        {"id": "b\"\\]}", "key": [2, u"é"], "value": None},
+        {"id": "c", "key": [3, -1.5e3], "value": True},
+    ]
+}, indent=1)
+
+
+def items(doc, prefix, chunk_size=3):
+    return list(iter_json(StringIO(doc), prefix, chunk_size=chunk_size))
+
+def test_001():
+    rows = json.loads(DOC)["rows"]
+    for chunk_size in (1, 2, 7, 4096):
+        t.eq(items(DOC, "rows.item", chunk_size), rows)
+    t.eq(items(DOC, "rows.item.id"), ["a", "b\"\\]}", "c"])
+    t.eq(items(DOC, "rows.item.key.item"), [1, "x", 2, u"é", 3, -1500.0])
+    t.eq(items(DOC, "meta.rows.item"), [{"id": "skipped"}])
+    t.eq(items(DOC, "total_rows"), [3])
+    t.eq(items(DOC, ""), [json.loads(DOC)])
+    t.eq(items(DOC, "missing.item"), [])
+
+def test_002():
+    t.eq(items("[1, 2.5, \"s\", null, [true], {}]", "item"),
+            [1, 2.5, "s", None, [True], {}])
+    t.eq(items("  42  ", ""), [42])
+    t.eq(items("[]", "item"), [])
+    t.eq(items("[[1, 2], [3]]", "item.item"), [1, 2, 3])
+
+def test_003():
+    for doc in ("", "[1, 2", "{\"rows\": [1]", "[1, tru]", "[1] 2",
+            "{1: 2}", "[\"abc", "]", "[1 2]", "[1,]", "[,1]", "[1}",
+            "[1:2]", "{\"a\": 1 \"b\": 2}", "[1] [2]"):
+        t.raises(ValueError, items, doc, "item")
+    for doc in ("{\"a\":}", "{\"a\" 1}", "{\"a\": 1,}", "{\"a\": [1 2]}",
+            "{\"b\": [1 2], \"a\": 1}", "{\"b\": {\"c\" 1}, \"a\": 1}"):
+        for chunk_size in (1, 3, 4096):
+            t.raises(ValueError, items, doc, "a", chunk_size)
+
+@t.client_request('/json')
+def test_004(u, c):
+    r = c.request(u, 'POST', body=DOC,
+            headers={'Content-Type': 'application/json'})
+    rows = r.iter_json("rows.item")
+    t.eq(rows.next()["id"], "a")
+    t.eq([row["id"] for row in rows], ["b\"\\]}", "c"])
+    t.eq(r.can_read(), False)
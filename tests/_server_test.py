@@ -35,6 +35,7 @@ from restkit.util import to_bytestring
 
 HOST = 'localhost'
 PORT = (os.getpid() % 31000) + 1024
+RETRIES = {}
 
 class HTTPTestHandler(BaseHTTPRequestHandler):
 
@@ -139,6 +140,18 @@ class HTTPTestHandler(BaseHTTPRequestHandler):
             for k in c.keys():
                 extra_headers.append(('Set-Cookie', str(c[k].output(header=''))))
             self._respond(200, extra_headers, "ok")
+
+        elif path == "/retry":
+            # fail until the number of tries given in the query is reached
+            key = self.query.get("key", "")
+            tries = RETRIES[key] = RETRIES.get(key, 0) + 1
+            if tries < int(self.query.get("tries", 1)):
+                extra_headers = [('Content-type', 'text/plain'),
+                        ('Retry-After', '0')]
+                self._respond(503, extra_headers, "unavailable")
+            else:
+                extra_headers = [('Content-type', 'text/plain')]
+                self._respond(200, extra_headers, str(tries))
         
         else:
             self._respond(404, 
@@ -306,6 +319,10 @@ class HTTPTestHandler(BaseHTTPRequestHandler):
         if self.path == "/delete":
             extra_headers = [('Content-type', 'text/plain')]
             self._respond(200, extra_headers, '')
+        elif self.path == "/redirect":
+            extra_headers = [('Content-type', 'text/plain'),
+                ('Location', '/delete')]
+            self._respond(301, extra_headers, '')
         else:
             self.error_Response()
 